@@ -55,6 +55,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "posts.middleware.EntitlementMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -72,6 +73,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "posts.context_processors.entitlement",
             ],
             "libraries": {
                 "custom_filters": "posts.filters",  # Путь к вашему файлу фильтров
@@ -139,9 +141,18 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
-STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+# Образ собирает статику в /srv/static (см. Dockerfile), контейнер копирует её в том для nginx
+STATIC_ROOT = os.getenv("STATIC_ROOT", os.path.join(BASE_DIR, "staticfiles"))
 
-STATICFILES_STORAGE = "django.contrib.staticfiles.storage.StaticFilesStorage"
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        # Имена с хешем содержимого и заранее сжатые копии .gz/.br (config.storages)
+        "BACKEND": "config.storages.CompressedManifestStaticFilesStorage",
+    },
+}
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
@@ -185,6 +196,19 @@ SESSION_COOKIE_HTTPONLY = True
 SESSION_SAVE_EVERY_REQUEST = True
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")  # Подпись вебхука users:stripe_webhook (whsec_…)
+
+# Файлы постов отдаёт nginx по X-Accel-Redirect после проверки прав в posts.media;
+# без nginx (разработка, тесты) файл отдаёт сам Django
+PROTECTED_MEDIA_X_ACCEL = os.getenv("PROTECTED_MEDIA_X_ACCEL", "True") == "True"
+PROTECTED_MEDIA_INTERNAL_URL = "/protected-media/"
+
+# Загрузка файлов постов частями (posts.uploads): предел размера файла и одной части
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", 2 * 1024**3))
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024**2
+
+# Процессы нарезки уменьшенных копий изображений (posts.images); 0 — нарезать сразу в процессе запроса
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", 2))
 
 
 CACHES = {
@@ -195,9 +219,19 @@ CACHES = {
 }
 
 if "test" in sys.argv:
-    DATABASES = {
+    # TEST_POSTGRES=1 оставляет PostgreSQL из POSTGRES_*: так в CI проверяются планы запросов (QueryPlanTest)
+    if not os.getenv("TEST_POSTGRES"):
+        DATABASES = {
+            "default": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": BASE_DIR / "test_db_sqlite3",
+            }
+        }
+    CACHES = {
         "default": {
-            "ENGINE": "django.db.backends.sqlite3",
-            "NAME": BASE_DIR / "test_db_sqlite3",
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         }
     }
+    IMAGE_DERIVATIVE_WORKERS = 0
+    PROTECTED_MEDIA_X_ACCEL = False
+    STORAGES["staticfiles"]["BACKEND"] = "django.contrib.staticfiles.storage.StaticFilesStorage"
@@ -0,0 +1,48 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Необязательная зависимость: без неё собираются только .gz
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {"css", "js", "map", "svg", "json", "txt", "xml", "html", "ico", "ttf", "eot"}
+MIN_COMPRESS_SIZE = 256  # Меньшие файлы сжатие почти не уменьшает
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Статика с хешем содержимого в имени (style.3f2a….css) и заранее сжатыми копиями .gz и .br рядом.
+    Всё считается один раз при collectstatic во время сборки образа; nginx отдаёт готовые копии
+    (gzip_static) и кеширует файлы с хешем навсегда.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in sorted(hashed_names):
+            self.compress(hashed_name)
+
+    def compress(self, name):
+        if name.rsplit(".", 1)[-1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        path = self.path(name)
+        with open(path, "rb") as source:
+            content = source.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants[".br"] = brotli.compress(content, quality=11)
+        for suffix, compressed in variants.items():
+            if len(compressed) < len(content):
+                with open(path + suffix, "wb") as target:
+                    target.write(compressed)
+                os.utime(path + suffix, (os.path.getatime(path), os.path.getmtime(path)))
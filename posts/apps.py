@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
@@ -6,4 +7,7 @@ class PostsConfig(AppConfig):
     name = "posts"
 
     def ready(self):
-        pass  # Сюда можно поместить дополнительную инициализацию
+        import posts.signals  # noqa: F401
+        from posts.search import reinstall_search_index
+
+        post_migrate.connect(reinstall_search_index, sender=self)
@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = "posts/includes/inc_post_card.html"
+CARD_TEMPLATE_VERSION = 5  # Увеличить при изменении шаблона карточки
+CARD_CACHE_KEY = "post_card:{pk}:{version}:{variant}"
+CARD_CACHE_TIMEOUT = 60 * 60 * 12  # Не дольше половины срока ссылок на платные файлы (posts.media)
+CARD_VARIANTS = ("public", "anonymous", "subscriber", "author")
+
+
+def card_variant(post, entitlement):
+    """
+    Вариант карточки для посетителя. Бесплатные посты выглядят для всех одинаково,
+    у платных карточка без подписки закрыта плашкой.
+    """
+    if not post.premium:
+        return "public"
+    if entitlement.is_author(post):
+        return "author"
+    if entitlement.is_subscriber:
+        return "subscriber"
+    return "anonymous"
+
+
+def card_cache_key(post, variant):
+    """Версия ключа — время последнего сохранения поста, поэтому правка поста даёт новый ключ"""
+    version = f"{CARD_TEMPLATE_VERSION}.{post.updated_at.timestamp()}"
+    return CARD_CACHE_KEY.format(pk=post.pk, version=version, variant=variant)
+
+
+def render_cards(posts, entitlement):
+    """HTML карточек постов: готовые берутся из кеша одним get_many, недостающие рендерятся и сохраняются"""
+    keys = [card_cache_key(post, card_variant(post, entitlement)) for post in posts]
+    cached = cache.get_many(keys)
+
+    cards, missing = [], {}
+    for post, key in zip(posts, keys):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(CARD_TEMPLATE, {"post": post, "locked": entitlement.is_locked(post)})
+            missing[key] = html
+        cards.append(mark_safe(html))
+
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+    return cards
+
+
+def invalidate_cards(post):
+    """Удаление всех вариантов карточки поста из кеша"""
+    cache.delete_many([card_cache_key(post, variant) for variant in CARD_VARIANTS])
@@ -0,0 +1,3 @@
+def entitlement(request):
+    """Права на платный контент в контексте шаблонов (см. EntitlementMiddleware)"""
+    return {"entitlement": getattr(request, "entitlement", None)}
@@ -0,0 +1,161 @@
+import re
+from functools import lru_cache, wraps
+
+import redis
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from posts.models import Post
+
+VIEW_BASE_KEY = "post:views:base:{pk}"
+VIEW_BASE_TIMEOUT = 60 * 60 * 24
+FLUSH_BATCH_SIZE = 500
+
+
+class ViewCounter:
+    """
+    Буфер просмотров постов: просмотры копятся в кеше и периодически переносятся
+    в Post.view_count (команда flush_view_counts). Показываемое значение — счётчик из БД
+    плюс ещё не сброшенные просмотры; значение из БД тоже берётся из кеша.
+    Эта реализация работает поверх любого бэкенда кеша, но не атомарна — только для разработки и тестов.
+    """
+
+    PENDING_KEY = "post:views:pending"
+
+    def increment(self, pk, amount=1):
+        key = f"{self.PENDING_KEY}:{pk}"
+        if not cache.add(key, amount, None):
+            cache.incr(key, amount)
+        pending_ids = cache.get(self.PENDING_KEY, set())
+        if pk not in pending_ids:
+            cache.set(self.PENDING_KEY, pending_ids | {pk}, None)
+
+    def pending(self, pks):
+        values = cache.get_many([f"{self.PENDING_KEY}:{pk}" for pk in pks])
+        return {pk: values.get(f"{self.PENDING_KEY}:{pk}", 0) for pk in pks}
+
+    def take(self):
+        """Забирает накопленные просмотры для записи в БД: {pk: прирост}"""
+        pending_ids = cache.get(self.PENDING_KEY, set())
+        deltas = {pk: delta for pk, delta in self.pending(pending_ids).items() if delta}
+        cache.delete_many([f"{self.PENDING_KEY}:{pk}" for pk in pending_ids] + [self.PENDING_KEY])
+        return deltas
+
+    def done(self, pks):
+        """Прирост постов pks, отданный take(), записан в БД"""
+
+    def count(self, pk):
+        key = VIEW_BASE_KEY.format(pk=pk)
+        base = cache.get(key)
+        if base is None:
+            base = Post.objects.filter(pk=pk).values_list("view_count", flat=True).first() or 0
+            # add, а не set: не затираем значение, которое flush_view_counts мог записать за это время
+            cache.add(key, base, VIEW_BASE_TIMEOUT)
+        return base + self.pending([pk])[pk]
+
+    def set_base(self, counts):
+        cache.set_many({VIEW_BASE_KEY.format(pk=pk): count for pk, count in counts.items()}, VIEW_BASE_TIMEOUT)
+
+
+class RedisViewCounter(ViewCounter):
+    """
+    Просмотры в хеше Redis: HINCRBY атомарен и не зависит от числа воркеров.
+    Перед записью в БД хеш переименовывается, поэтому новые просмотры копятся в свежем хеше.
+    Записанные в БД посты удаляются из него пачками; если сброс прервался, следующий запуск
+    подхватит только недописанный остаток.
+    """
+
+    def __init__(self, client, pending_key, flushing_key):
+        self.client = client
+        self.pending_key = pending_key
+        self.flushing_key = flushing_key
+
+    @classmethod
+    def for_backend(cls, backend):
+        return cls(
+            redis_client(settings.CACHES["default"]["LOCATION"]),
+            backend.make_and_validate_key(cls.PENDING_KEY),
+            backend.make_and_validate_key(f"{cls.PENDING_KEY}:flushing"),
+        )
+
+    def increment(self, pk, amount=1):
+        self.client.hincrby(self.pending_key, pk, amount)
+
+    def pending(self, pks):
+        pks = list(pks)
+        if not pks:
+            return {}
+        pipeline = self.client.pipeline()
+        pipeline.hmget(self.pending_key, pks)
+        pipeline.hmget(self.flushing_key, pks)
+        pending, flushing = pipeline.execute()
+        return {pk: int(a or 0) + int(b or 0) for pk, a, b in zip(pks, pending, flushing)}
+
+    def take(self):
+        if self.client.exists(self.pending_key):
+            # Не перезаписывает хеш, оставшийся от прерванного сброса
+            self.client.renamenx(self.pending_key, self.flushing_key)
+        return {int(pk): int(delta) for pk, delta in self.client.hgetall(self.flushing_key).items()}
+
+    def done(self, pks):
+        if pks:
+            self.client.hdel(self.flushing_key, *pks)
+
+
+@lru_cache(maxsize=None)
+def redis_client(location):
+    """Клиент redis-py для сервера записи из LOCATION кеша (как в RedisCache — первый из списка)"""
+    servers = re.split("[;,]", location) if isinstance(location, str) else location
+    return redis.Redis.from_url(servers[0])
+
+
+def get_view_counter():
+    backend = caches["default"]
+    if isinstance(backend, RedisCache):
+        return RedisViewCounter.for_backend(backend)
+    return ViewCounter()
+
+
+def flush_view_counts(batch_size=FLUSH_BATCH_SIZE):
+    """
+    Переносит накопленные просмотры в Post.view_count пачками UPDATE ... SET view_count = view_count + CASE.
+    Пачка снимается с буфера последним шагом своей транзакции: если снять не удалось, UPDATE откатывается,
+    и повтор после сбоя не записывает её второй раз. Кешированная база обновляется только после фиксации,
+    когда прироста пачки в буфере уже нет, — читатель не видит просмотры дважды (новую базу и тот же прирост).
+    """
+    counter = get_view_counter()
+    deltas = counter.take()
+    pks = sorted(deltas)
+    for start in range(0, len(pks), batch_size):
+        stop = start + batch_size
+        batch = pks[start:stop]
+        increment = Case(
+            *[When(pk=pk, then=Value(deltas[pk])) for pk in batch],
+            default=Value(0),
+            output_field=PositiveIntegerField(),
+        )
+        with transaction.atomic():
+            Post.objects.filter(pk__in=batch).update(view_count=F("view_count") + increment)
+            counts = dict(Post.objects.filter(pk__in=batch).values_list("pk", "view_count"))
+            counter.done(batch)
+        counter.set_base(counts)
+    return sum(deltas.values())
+
+
+def counts_post_view(view):
+    """
+    Учитывает просмотр успешно открытой страницы поста, в том числе отданной из кеша страниц
+    или подтверждённой ответом 304 из кеша браузера
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.method == "GET" and response.status_code in (200, 304):
+            get_view_counter().increment(kwargs["pk"])
+        return response
+
+    return wrapper
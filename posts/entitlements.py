@@ -0,0 +1,96 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.dispatch import Signal
+from django.utils.timezone import now
+
+from posts.models import Subscription
+
+ENTITLEMENT_CACHE_KEY = "entitlement:{user_id}"
+ENTITLEMENT_CACHE_TIMEOUT = 60 * 60  # Верхняя граница хранения в кеше, секунды
+NO_SUBSCRIPTION = 0  # Маркер «подписки нет», т.к. None кеш не отличает от промаха
+EXPIRE_BATCH_SIZE = 1000
+
+# Подписки сняты с активных: sender=Subscription, subscriptions — список пар (id подписки, id пользователя)
+subscription_expired = Signal()
+
+
+class Entitlement:
+    """
+    Права посетителя на платный контент.
+    Вычисляются один раз на запрос и читаются представлениями и шаблонами.
+    """
+
+    def __init__(self, user_id=None, subscription_ends_at=None):
+        self.user_id = user_id
+        self.subscription_ends_at = subscription_ends_at
+
+    @property
+    def is_authenticated(self):
+        return self.user_id is not None
+
+    @property
+    def is_subscriber(self):
+        """Подписка действует, пока не наступил ends_at (как в Subscription.is_valid)"""
+        return self.subscription_ends_at is not None and self.subscription_ends_at > now()
+
+    def is_author(self, post):
+        return self.is_authenticated and post.author_id == self.user_id
+
+    def can_view(self, post):
+        return not post.premium or self.is_author(post) or self.is_subscriber
+
+    def is_locked(self, post):
+        return not self.can_view(post)
+
+
+def get_entitlement(user):
+    """
+    Права пользователя; срок подписки берётся из кеша и хранится там не дольше её окончания.
+    Учитываются только активные подписки; ends_at страхует от истёкших, которые expire_subscriptions ещё не снял.
+    """
+    if not user.is_authenticated:
+        return Entitlement()
+
+    key = ENTITLEMENT_CACHE_KEY.format(user_id=user.pk)
+    ends_at = cache.get(key)
+    if ends_at is None:
+        ends_at = (
+            Subscription.objects.filter(user_id=user.pk, active=True, ends_at__gt=now()).aggregate(
+                ends_at=Max("ends_at")
+            )["ends_at"]
+            or NO_SUBSCRIPTION
+        )
+        timeout = ENTITLEMENT_CACHE_TIMEOUT
+        if ends_at != NO_SUBSCRIPTION:
+            timeout = min(timeout, max(int((ends_at - now()).total_seconds()), 1))
+        cache.set(key, ends_at, timeout)
+
+    return Entitlement(user.pk, None if ends_at == NO_SUBSCRIPTION else ends_at)
+
+
+def invalidate_entitlement(user_id):
+    cache.delete(ENTITLEMENT_CACHE_KEY.format(user_id=user_id))
+
+
+def expire_subscriptions(batch_size=EXPIRE_BATCH_SIZE):
+    """
+    Снимает флаг active с истёкших подписок пачками: выборка по частичному индексу subscription_expiry_idx
+    и один UPDATE на пачку. После фиксации каждой пачки отправляется subscription_expired.
+    Возвращает число снятых подписок.
+    """
+    expired = 0
+    while True:
+        with transaction.atomic():
+            # Строки пачки заблокированы до UPDATE: продление в это время подождёт, параллельный запуск пропустит их
+            batch = list(
+                Subscription.objects.select_for_update(skip_locked=True)
+                .filter(active=True, ends_at__lte=now())
+                .order_by("ends_at")
+                .values_list("pk", "user_id")[:batch_size]
+            )
+            if not batch:
+                return expired
+            Subscription.objects.filter(pk__in=[pk for pk, _ in batch]).update(active=False)
+        expired += len(batch)
+        subscription_expired.send(sender=Subscription, subscriptions=batch)
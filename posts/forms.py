@@ -1,10 +1,16 @@
 from django.core.exceptions import ValidationError
-from django.forms import BooleanField, ModelForm
+from django.forms import BooleanField, HiddenInput, IntegerField, ModelForm, UUIDField
 
-from posts.constants import FORBIDDEN_WORDS
-from posts.models import Post
+from posts.models import Comment, Post, UploadSession
+from posts.moderation import forbidden_words
 
-forbidden_list = FORBIDDEN_WORDS
+
+def reject_forbidden_words(text):
+    """Текст без запрещённых слов в любой форме (см. posts.moderation), иначе ValidationError"""
+    matches = forbidden_words.find(text)
+    if matches:
+        raise ValidationError(f"Введено  недопустимое  слово '{matches[0][0]}'.")
+    return text
 
 
 class StyleFormMixin:
@@ -18,6 +24,8 @@ class StyleFormMixin:
 
 
 class PostForm(StyleFormMixin, ModelForm):
+    # Файл, загруженный частями через posts:upload_start (см. posts.uploads), вместо поля file
+    upload = UUIDField(required=False, widget=HiddenInput)
 
     class Meta:
         model = Post
@@ -40,31 +48,29 @@ class PostForm(StyleFormMixin, ModelForm):
         obj = super().save(commit=False)
         obj.author = self.user  # Устанавливаем текущего пользователя автором
         obj.public = True  # Публикуем запись автоматически
+        upload = self.cleaned_data.get("upload")
+        if upload is not None:
+            obj.file.name = upload.name  # Файл уже лежит на своём месте в uploads/
         if commit:
             obj.save()
+            if upload is not None:
+                upload.delete()
         return obj
 
-    def clean_title(self):
-
-        cleaned_data = super().clean()
-        name = cleaned_data.get("title").strip().lower()
-        words_in_name = name.split()
+    def clean_upload(self):
+        upload_id = self.cleaned_data.get("upload")
+        if upload_id is None:
+            return None
+        upload = UploadSession.objects.filter(pk=upload_id, user=self.user, completed=True).first()
+        if upload is None:
+            raise ValidationError("Загрузка файла не найдена или не завершена.")
+        return upload
 
-        for word in words_in_name:
-            if word in FORBIDDEN_WORDS:
-                raise ValidationError(f"Введено  недопустимое  слово '{word}'.")
-        return cleaned_data.get("title")
+    def clean_title(self):
+        return reject_forbidden_words(self.cleaned_data.get("title"))
 
     def clean_description(self):
-
-        cleaned_data = super().clean()
-        description = cleaned_data.get("description").strip().lower()
-        words_in_description = description.split()
-
-        for word in words_in_description:
-            if word in forbidden_list:
-                raise ValidationError(f"Введено  недопустимое  слово '{word}'.")
-        return cleaned_data.get("description")
+        return reject_forbidden_words(self.cleaned_data.get("description"))
 
     def clean_price(self):
 
@@ -75,3 +81,13 @@ class PostForm(StyleFormMixin, ModelForm):
         if price < 0:
             raise ValidationError("Цена не может быть отрицательной.")
         return price
+
+
+class CommentForm(StyleFormMixin, ModelForm):
+    # id комментария, на который отвечают; сам комментарий ищет представление среди комментариев поста
+    parent = IntegerField(required=False, min_value=1, widget=HiddenInput)
+
+    class Meta:
+        model = Comment
+        fields = ["text"]
+        labels = {"text": "Комментарий"}
@@ -0,0 +1,113 @@
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils.timezone import now
+from PIL import Image, ImageOps
+
+from posts.models import Post
+from posts.page_cache import invalidate_pages
+
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp"}
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_FORMATS = {
+    "webp": {"quality": 80, "method": 4},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+DERIVATIVES_DIR = "derivatives"
+# Битый файл, «декомпрессионная бомба» и неподдерживаемый режим изображения не должны ронять поток пула или запрос
+RENDER_ERRORS = (OSError, Image.DecompressionBombError, ValueError)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def is_image(name):
+    return bool(name) and name.rsplit(".", 1)[-1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_name(name, width, fmt):
+    """uploads/2025/01/01/photo.png -> derivatives/uploads/2025/01/01/photo/640.webp"""
+    return str(PurePosixPath(DERIVATIVES_DIR) / PurePosixPath(name).with_suffix("") / f"{width}.{fmt}")
+
+
+def derivatives_dir(name):
+    """Каталог всех уменьшенных копий файла на диске"""
+    return default_storage.path(str(PurePosixPath(DERIVATIVES_DIR) / PurePosixPath(name).with_suffix("")))
+
+
+def delete_derivatives(name):
+    shutil.rmtree(derivatives_dir(name), ignore_errors=True)
+
+
+def render_derivatives(source, name, media_root):
+    """
+    Нарезка производных одного изображения. Функция не трогает Django и БД,
+    поэтому выполняется в отдельном процессе пула. Изображения не увеличиваются.
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    for fmt, options in DERIVATIVE_FORMATS.items():
+        converted = image.convert("RGBA" if fmt == "webp" and "A" in image.getbands() else "RGB")
+        for width in DERIVATIVE_WIDTHS:
+            resized = converted.copy()
+            resized.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+            target = os.path.join(media_root, derivative_name(name, width, fmt))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            resized.save(target, fmt.upper(), **options)
+    return name
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS)
+    return _executor
+
+
+def mark_derivatives_ready(pk, name):
+    """Флаг ставится, только если файл поста не сменился, пока шла нарезка; updated_at обновляет кеш карточки"""
+    updated = Post.objects.filter(pk=pk, file=name).update(has_derivatives=True, updated_at=now())
+    if updated:
+        invalidate_pages("feed", f"post:{pk}")
+    return updated
+
+
+def _on_done(pk, name):
+    def callback(future):
+        # Колбэк выполняется в служебном потоке пула: своё соединение с БД закрываем сами
+        try:
+            future.result()
+            mark_derivatives_ready(pk, name)
+        except RENDER_ERRORS:
+            logger.exception("Не удалось нарезать копии %s", name)
+        finally:
+            connection.close()
+
+    return callback
+
+
+def schedule_derivatives(post):
+    """Нарезает производные изображения поста после коммита: в пуле процессов или сразу, если пул отключён"""
+    name = post.file.name
+
+    def submit():
+        args = (default_storage.path(name), name, str(settings.MEDIA_ROOT))
+        if not settings.IMAGE_DERIVATIVE_WORKERS:
+            try:
+                render_derivatives(*args)
+            except RENDER_ERRORS:
+                logger.exception("Не удалось нарезать копии %s", name)
+            else:
+                mark_derivatives_ready(post.pk, name)
+            return
+        get_executor().submit(render_derivatives, *args).add_done_callback(_on_done(post.pk, name))
+
+    transaction.on_commit(submit)
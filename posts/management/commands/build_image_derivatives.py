@@ -0,0 +1,42 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts.images import RENDER_ERRORS, is_image, mark_derivatives_ready, render_derivatives
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Нарезает уменьшенные копии изображений существующих постов в нескольких процессах"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Пересоздать копии и у постов, где они уже есть")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Количество процессов")
+        parser.add_argument("--batch-size", type=int, default=500, help="Сколько файлов отдавать пулу за раз")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(file="").exclude(file__isnull=True)
+        if not options["all"]:
+            posts = posts.filter(has_derivatives=False)
+        images = ((pk, name) for pk, name in posts.values_list("pk", "file").iterator() if is_image(name))
+
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            while batch := [item for _, item in zip(range(options["batch_size"]), images)]:
+                futures = {}
+                for pk, name in batch:
+                    source = default_storage.path(name)
+                    futures[executor.submit(render_derivatives, source, name, str(settings.MEDIA_ROOT))] = (pk, name)
+                for future in as_completed(futures):
+                    pk, name = futures[future]
+                    try:
+                        future.result()
+                    except RENDER_ERRORS as e:  # Битое изображение не останавливает весь прогон
+                        failed += 1
+                        self.stderr.write(f"{name}: {e}")
+                    else:
+                        done += mark_derivatives_ready(pk, name)
+        self.stdout.write(f"Готово: {done}, ошибок: {failed}")
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts.uploads import STALE_UPLOAD_AGE, clear_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Удаляет брошенные загрузки файлов частями вместе с недокачанными файлами"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=int, default=STALE_UPLOAD_AGE // timedelta(hours=1), help="Возраст брошенной загрузки"
+        )
+
+    def handle(self, *args, **options):
+        removed = clear_stale_uploads(timedelta(hours=options["hours"]))
+        self.stdout.write(f"Удалено загрузок: {removed}")
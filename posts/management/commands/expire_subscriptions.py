@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.entitlements import EXPIRE_BATCH_SIZE, expire_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Снимает флаг активности с подписок, срок которых истёк"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=int, default=0, help="Повторять каждые N секунд (0 — один раз)")
+        parser.add_argument("--batch-size", type=int, default=EXPIRE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_subscriptions(batch_size=options["batch_size"])
+            self.stdout.write(f"Истекло подписок: {expired}")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
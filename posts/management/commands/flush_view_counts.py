@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.counters import FLUSH_BATCH_SIZE, flush_view_counts
+
+
+class Command(BaseCommand):
+    help = "Переносит накопленные в Redis просмотры постов в Post.view_count"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=int, default=0, help="Повторять каждые N секунд (0 — один раз)")
+        parser.add_argument("--batch-size", type=int, default=FLUSH_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            views = flush_view_counts(options["batch_size"])
+            self.stdout.write(f"Записано просмотров: {views}")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post, SearchTerm
+from posts.search import count_title_terms
+
+
+class Command(BaseCommand):
+    help = "Пересобирает словарь поисковых подсказок по заголовкам всех постов"
+
+    def handle(self, *args, **options):
+        counter = count_title_terms(Post.objects.values_list("title", flat=True).iterator(chunk_size=2000))
+        with transaction.atomic():
+            SearchTerm.objects.all().delete()
+            SearchTerm.objects.bulk_create(
+                [SearchTerm(term=term, frequency=frequency) for term, frequency in counter.items()],
+                batch_size=1000,
+            )
+        self.stdout.write(f"Слов в словаре: {len(counter)}")
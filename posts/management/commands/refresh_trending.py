@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.trending import REFRESH_BATCH_SIZE, refresh_trending
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает рейтинг популярного для постов, у которых изменились просмотры, лайки или комментарии"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Пересчитать все посты окна")
+        parser.add_argument("--interval", type=int, default=0, help="Повторять каждые N секунд (0 — один раз)")
+        parser.add_argument("--batch-size", type=int, default=REFRESH_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            refreshed = refresh_trending(full=full, batch_size=options["batch_size"])
+            self.stdout.write(f"Пересчитано рейтингов: {refreshed}")
+            if not options["interval"]:
+                break
+            full = False
+            time.sleep(options["interval"])
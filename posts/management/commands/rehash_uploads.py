@@ -0,0 +1,73 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from posts.images import delete_derivatives, derivatives_dir
+from posts.models import Post
+from posts.page_cache import invalidate_pages
+from posts.services import recount_file_references
+from posts.storage import PARTIAL_DIR, content_storage, is_content_name, name_extension
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = "Переносит файлы постов из uploads/%Y/%m/%d/ в хранилище по содержимому и пересчитывает ссылки на файлы"
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(file="").exclude(file__isnull=True).values_list("file", flat=True)
+        legacy = sorted({name for name in names.iterator() if not is_content_name(name)})
+
+        moved = missing = 0
+        for name in legacy:
+            if not content_storage.exists(name):
+                missing += 1
+                self.stderr.write(f"{name}: файл не найден")
+                continue
+            new_name = self.relink(name)
+            self.update_posts(Post.objects.filter(file=name), file=new_name)
+            self.move_derivatives(name, new_name)
+            content_storage.delete(name)
+            moved += 1
+
+        stored = recount_file_references()
+        self.stdout.write(f"Перенесено файлов: {moved}, не найдено: {missing}, файлов в хранилище: {stored}")
+
+    def relink(self, name):
+        """
+        Жёсткая ссылка на файл переносится на место по хешу, старое имя удаляется только после
+        обновления постов: прерванный запуск можно просто повторить
+        """
+        digest = hashlib.sha256()
+        with content_storage.open(name, "rb") as source:
+            for block in iter(lambda: source.read(READ_BLOCK_SIZE), b""):
+                digest.update(block)
+        os.makedirs(content_storage.path(PARTIAL_DIR), exist_ok=True)
+        link = os.path.join(tempfile.mkdtemp(dir=content_storage.path(PARTIAL_DIR)), "file")
+        os.link(content_storage.path(name), link)
+        new_name = content_storage.adopt(link, digest.hexdigest(), name_extension(name))
+        os.rmdir(os.path.dirname(link))
+        return new_name
+
+    def update_posts(self, posts, **fields):
+        """
+        Смена файла меняет ссылки в карточках: updated_at сбрасывает кеш карточки (posts.cards),
+        а страницы ленты и поста сбрасываются явно — старый файл сейчас будет удалён
+        """
+        pks = list(posts.values_list("pk", flat=True))
+        Post.objects.filter(pk__in=pks).update(updated_at=now(), **fields)
+        invalidate_pages("feed", *(f"post:{pk}" for pk in pks))
+
+    def move_derivatives(self, name, new_name):
+        """Уменьшенные копии переезжают вслед за файлом, и нарезать их заново не нужно"""
+        old_dir, new_dir = derivatives_dir(name), derivatives_dir(new_name)
+        if not os.path.isdir(old_dir):
+            return
+        if os.path.isdir(new_dir):  # Такой же файл уже переносили вместе с копиями
+            self.update_posts(Post.objects.filter(file=new_name), has_derivatives=True)
+            delete_derivatives(name)
+        else:
+            os.renames(old_dir, new_dir)
@@ -0,0 +1,36 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.moderation import scan_posts
+
+
+class Command(BaseCommand):
+    help = "Проверяет все посты по текущему списку запрещённых слов в нескольких процессах"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--unpublish", action="store_true", help="Снять найденные посты с публикации")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Количество процессов")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Сколько постов отдавать процессу за раз")
+
+    def handle(self, *args, **options):
+        rows = Post.objects.order_by("pk").values_list("pk", "title", "description").iterator(chunk_size=2000)
+        batches = iter(lambda: [row for _, row in zip(range(options["batch_size"]), rows)], [])
+
+        found = {}
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            # По пачке на процесс за раз: в памяти не больше workers × batch_size постов
+            while window := [batch for _, batch in zip(range(options["workers"]), batches)]:
+                for result in executor.map(scan_posts, window):
+                    found.update(result)
+
+        for pk, words in found.items():
+            self.stdout.write(f"Пост {pk}: {', '.join(words)}")
+        if options["unpublish"]:
+            # По одному через save(): сигналы сбрасывают кеш страниц и карточек
+            for post in Post.objects.filter(pk__in=found, public=True):
+                post.public = False
+                post.save(update_fields=["public", "updated_at"])
+        self.stdout.write(f"Найдено постов: {len(found)}")
@@ -0,0 +1,151 @@
+import codecs
+import mimetypes
+import posixpath
+from itertools import chain
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.http import urlencode
+
+from posts.images import DERIVATIVES_DIR
+from posts.models import Post
+
+PROTECTED_MEDIA_DIRS = ("uploads/", f"{DERIVATIVES_DIR}/")
+PUBLIC_SALT = "posts.media.public"
+PREMIUM_SALT = "posts.media.premium"
+# Ссылка на платный файл живёт сутки; карточки со ссылками кешируются вдвое меньше (см. posts.cards)
+PREMIUM_URL_MAX_AGE = 60 * 60 * 24
+# Бесплатный файл может стать платным вместе с постом, поэтому в общих кешах (CDN, прокси) он не хранится
+FREE_CACHE_CONTROL = "private, max-age=86400"
+PREMIUM_CACHE_CONTROL = "private, max-age=3600"
+PREVIEW_TEMPLATE = "posts/post_preview.html"
+PREVIEW_CONTENT_MARKER = "<!--preview-content-->"
+PREVIEW_MAX_BYTES = 64 * 1024  # Сколько байт текстового файла показывает предпросмотр
+PREVIEW_BLOCK_SIZE = 8 * 1024
+TEXT_MIME_TYPES = {"application/json", "application/xml", "application/javascript"}
+
+
+def media_url(name, premium):
+    """
+    Подписанная ссылка на файл поста. Ссылки на бесплатные файлы бессрочные, но действуют, только пока файл
+    принадлежит бесплатному посту; на платные — истекают через PREMIUM_URL_MAX_AGE. Выдавать платные ссылки
+    можно только тем, кто вправе видеть пост: сама ссылка — пропуск к файлу.
+    """
+    if premium:
+        signature = signing.TimestampSigner(salt=PREMIUM_SALT).sign(name).rsplit(":", 2)
+        query = {"t": signature[1], "s": signature[2]}
+    else:
+        query = {"s": signing.Signer(salt=PUBLIC_SALT).signature(name)}
+    return f"{reverse('posts:protected_media', kwargs={'path': name})}?{urlencode(query)}"
+
+
+def _signed_access(name, params):
+    """Возвращает "public"/"premium", если ссылка подписана верно и не истекла"""
+    signature = params.get("s")
+    if not signature:
+        return None
+    try:
+        if "t" in params:
+            signing.TimestampSigner(salt=PREMIUM_SALT).unsign(
+                f"{name}:{params['t']}:{signature}", max_age=PREMIUM_URL_MAX_AGE
+            )
+            return "premium"
+        signing.Signer(salt=PUBLIC_SALT).unsign(f"{name}:{signature}")
+        return "public"
+    except signing.BadSignature:  # В том числе SignatureExpired
+        return None
+
+
+def owner_posts(name):
+    """
+    Посты с этим файлом или его уменьшенной копией. Одинаковые загрузки хранятся одним файлом
+    (posts.storage), поэтому постов может быть несколько: бесплатные идут первыми.
+    """
+    posts = Post.objects.only("pk", "premium", "author").order_by("premium", "pk")
+    if name.startswith(f"{DERIVATIVES_DIR}/"):
+        stem = posixpath.dirname(name.removeprefix(f"{DERIVATIVES_DIR}/"))
+        return posts.filter(file__startswith=f"{stem}.")
+    return posts.filter(file=name)
+
+
+def serve_media(name, cache_control):
+    """
+    Отдача файла: при PROTECTED_MEDIA_X_ACCEL ответ пустой, а файл отдаёт nginx из internal-локации
+    (sendfile, Range для перемотки видео). Без nginx — FileResponse, для разработки и тестов.
+    """
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if settings.PROTECTED_MEDIA_X_ACCEL:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.PROTECTED_MEDIA_INTERNAL_URL + quote(name)
+    else:
+        if not default_storage.exists(name):
+            raise Http404("Файл не найден")
+        response = FileResponse(default_storage.open(name), content_type=content_type)
+    response["Cache-Control"] = cache_control
+    return response
+
+
+def protected_media_response(request, path):
+    name = posixpath.normpath(path)
+    if name != path or not name.startswith(PROTECTED_MEDIA_DIRS):
+        raise Http404("Файл не найден")
+
+    if _signed_access(name, request.GET) == "premium":
+        return serve_media(name, PREMIUM_CACHE_CONTROL)
+
+    # Бессрочная ссылка на бесплатный файл, ссылка без подписи или просроченная: файл доступен,
+    # если посетитель вправе видеть хоть один его пост. Пост мог стать платным после выдачи ссылки,
+    # поэтому владельцы файла проверяются при каждом запросе
+    posts = owner_posts(name)
+    if not posts:
+        raise Http404("Файл не найден")
+    post = next((post for post in posts if request.entitlement.can_view(post)), None)
+    if post is None:
+        return HttpResponse("Файл доступен только подписчикам.", status=403)
+    return serve_media(name, PREMIUM_CACHE_CONTROL if post.premium else FREE_CACHE_CONTROL)
+
+
+def is_text(mime_type):
+    return mime_type.startswith("text/") or mime_type in TEXT_MIME_TYPES
+
+
+def preview_text(file, limit=PREVIEW_MAX_BYTES):
+    """
+    Начало текстового файла экранированными кусками: читается не больше limit байт блоками,
+    поэтому память на запрос не зависит от размера файла. UTF-8, разрезанный на границе блока, собирается декодером.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    remaining = limit
+    try:
+        while remaining and (block := file.read(min(PREVIEW_BLOCK_SIZE, remaining))):
+            remaining -= len(block)
+            yield escape(decoder.decode(block))
+        if not remaining and file.read(1):
+            yield "\n…"  # Символ, разрезанный пределом, отбрасывается вместе с остатком файла
+        else:
+            yield escape(decoder.decode(b"", final=True))
+    finally:
+        file.close()
+
+
+def preview_response(request, post):
+    """
+    Предпросмотр файла поста. Текст отдаётся страницей, которая рендерится по кускам вокруг метки
+    PREVIEW_CONTENT_MARKER; остальные файлы — потоком через serve_media, как по ссылке на файл.
+    """
+    if not post.file:
+        raise Http404("У поста нет файла")
+    if not is_text(post.mime_type):
+        return serve_media(post.file.name, PREMIUM_CACHE_CONTROL if post.premium else FREE_CACHE_CONTROL)
+    try:
+        file = post.file.storage.open(post.file.name, "rb")
+    except FileNotFoundError:
+        raise Http404("Файл не найден")
+    head, _, tail = render_to_string(PREVIEW_TEMPLATE, {"post": post}, request).partition(PREVIEW_CONTENT_MARKER)
+    return StreamingHttpResponse(chain([head], preview_text(file), [tail]))
@@ -0,0 +1,86 @@
+import mimetypes
+import struct
+
+from PIL import Image, UnidentifiedImageError
+
+from posts.models import MediaType
+
+# Контейнеры-боксы MP4, внутри которых лежат заголовки ролика и дорожек
+MP4_CONTAINERS = {b"moov", b"trak"}
+
+
+def _mp4_boxes(file, end):
+    """Боксы MP4 от текущей позиции до end: (тип, начало содержимого, конец бокса). Содержимое не читается"""
+    while file.tell() + 8 <= end:
+        start = file.tell()
+        size, kind = struct.unpack(">I4s", file.read(8))
+        header = 8
+        if size == 1:
+            size, header = struct.unpack(">Q", file.read(8))[0], 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield kind, start + header, start + size
+        file.seek(start + size)
+
+
+def mp4_metadata(file, end):
+    """
+    Длительность из mvhd и размер кадра из tkhd первой видеодорожки. Файл обходится по заголовкам
+    боксов с перемоткой, поэтому читаются десятки байт даже у ролика, где moov записан в конце.
+    """
+    metadata = {}
+    for kind, start, stop in _mp4_boxes(file, end):
+        if kind in MP4_CONTAINERS:
+            for key, value in mp4_metadata(file, stop).items():
+                metadata.setdefault(key, value)
+        elif kind == b"mvhd":
+            version = file.read(1)[0]
+            file.seek(start + (20 if version else 12))
+            timescale, duration = struct.unpack(">IQ" if version else ">II", file.read(12 if version else 8))
+            if timescale:
+                metadata["duration"] = duration / timescale
+        elif kind == b"tkhd":
+            version = file.read(1)[0]
+            file.seek(start + (88 if version else 76))
+            width, height = struct.unpack(">II", file.read(8))
+            if width and height:  # У звуковой дорожки размеры нулевые
+                metadata.setdefault("width", width >> 16)
+                metadata.setdefault("height", height >> 16)
+    return metadata
+
+
+def extract_metadata(file):
+    """
+    Сведения о файле поста для колонок Post: вид медиа, MIME-тип, размер, размеры кадра и длительность.
+    Принимает файл поля Post.file — уже сохранённый или только что загруженный.
+    """
+    metadata = {"media_type": "", "mime_type": "", "file_size": None, "width": None, "height": None, "duration": None}
+    if not file:
+        return metadata
+    mime_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+    metadata["mime_type"] = mime_type
+    if mime_type.startswith("image/"):
+        metadata["media_type"] = MediaType.IMAGE
+    elif mime_type.startswith("video/"):
+        metadata["media_type"] = MediaType.VIDEO
+
+    try:
+        metadata["file_size"] = file.size
+        file.open("rb")
+    except OSError:  # Файла нет в хранилище: остаётся то, что известно по имени
+        return metadata
+    try:
+        if metadata["media_type"] == MediaType.IMAGE:
+            with Image.open(file) as image:  # Pillow читает только заголовок
+                metadata["width"], metadata["height"] = image.size
+        elif mime_type == "video/mp4":
+            metadata.update(mp4_metadata(file, file.size))
+    except (UnidentifiedImageError, struct.error, IndexError):  # Повреждённый или обрезанный заголовок
+        pass
+    finally:
+        file.seek(0)
+        if file._committed:  # Загруженный файл ещё нужен полю при сохранении, открытый из хранилища — нет
+            file.close()
+    return metadata
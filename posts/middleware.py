@@ -0,0 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
+from posts.entitlements import get_entitlement
+
+
+class EntitlementMiddleware:
+    """Добавляет в запрос request.entitlement — права на платный контент, вычисляемые при первом обращении"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.entitlement = SimpleLazyObject(lambda: get_entitlement(request.user))
+        return self.get_response(request)
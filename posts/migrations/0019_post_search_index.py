@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:00
+
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from posts.search import get_search_engine
+
+    get_search_engine(schema_editor.connection).install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from posts.search import get_search_engine
+
+    get_search_engine(schema_editor.connection).uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0018_post_created_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def install_suggestions(apps, schema_editor):
+    from posts.search import count_title_terms, get_search_engine
+
+    get_search_engine(schema_editor.connection).install_suggestions(schema_editor.connection)
+
+    Post = apps.get_model("posts", "Post")
+    SearchTerm = apps.get_model("posts", "SearchTerm")
+    counter = count_title_terms(Post.objects.values_list("title", flat=True).iterator())
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(term=term, frequency=frequency) for term, frequency in counter.items()], batch_size=1000
+    )
+
+
+def uninstall_suggestions(apps, schema_editor):
+    from posts.search import get_search_engine
+
+    get_search_engine(schema_editor.connection).uninstall_suggestions(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0019_post_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchTerm",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("term", models.CharField(max_length=100, unique=True, verbose_name="Слово")),
+                ("frequency", models.PositiveIntegerField(default=0, verbose_name="Количество постов")),
+            ],
+            options={
+                "verbose_name": "Поисковый термин",
+                "verbose_name_plural": "Поисковые термины",
+            },
+        ),
+        migrations.RunPython(install_suggestions, uninstall_suggestions),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0020_searchterm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now, verbose_name="Дата изменения"
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def dedupe_likes_and_count(apps, schema_editor):
+    """Удаляет повторные лайки одного пользователя и заполняет like_count"""
+    Like = apps.get_model("posts", "Like")
+    Post = apps.get_model("posts", "Post")
+
+    duplicates = Like.objects.values("user", "post").annotate(first=Min("id"), total=Count("id")).filter(total__gt=1)
+    for row in duplicates.iterator():
+        Like.objects.filter(user=row["user"], post=row["post"]).exclude(id=row["first"]).delete()
+
+    counts = Like.objects.filter(post=OuterRef("pk")).order_by().values("post").annotate(total=Count("id"))
+    Post.objects.update(like_count=Coalesce(Subquery(counts.values("total")), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0021_post_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Количество лайков"),
+        ),
+        migrations.RunPython(dedupe_likes_and_count, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="like",
+            constraint=models.UniqueConstraint(fields=("user", "post"), name="unique_like"),
+        ),
+    ]
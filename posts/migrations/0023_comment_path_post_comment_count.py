@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_paths_and_counts(apps, schema_editor):
+    """Существующие комментарии плоские: каждый становится корнем своей ветки"""
+    Comment = apps.get_model("posts", "Comment")
+    Post = apps.get_model("posts", "Post")
+
+    comments = list(Comment.objects.only("id"))
+    for comment in comments:
+        comment.path = f"{comment.id:010d}"
+    Comment.objects.bulk_update(comments, ["path"], batch_size=1000)
+
+    counts = Comment.objects.filter(post=OuterRef("pk")).order_by().values("post").annotate(total=Count("id"))
+    Post.objects.update(comment_count=Coalesce(Subquery(counts.values("total")), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0022_post_like_count_like_unique_like"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="comment_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Количество комментариев"),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="posts.comment",
+                verbose_name="Ответ на",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(default="", editable=False, max_length=255, verbose_name="Путь в ветке"),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Уровень вложенности"),
+        ),
+        migrations.RunPython(fill_paths_and_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "path"], name="comment_thread_idx", opclasses=["int8_ops", "varchar_pattern_ops"]
+            ),
+        ),
+    ]
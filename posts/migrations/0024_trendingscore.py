@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0023_comment_path_post_comment_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendingScore",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="trending",
+                        serialize=False,
+                        to="posts.post",
+                        verbose_name="Пост",
+                    ),
+                ),
+                ("score", models.FloatField(verbose_name="Рейтинг")),
+                ("view_count", models.PositiveIntegerField(default=0, verbose_name="Просмотры при расчёте")),
+                ("like_count", models.PositiveIntegerField(default=0, verbose_name="Лайки при расчёте")),
+                ("comment_count", models.PositiveIntegerField(default=0, verbose_name="Комментарии при расчёте")),
+                ("computed_at", models.DateTimeField(auto_now=True, verbose_name="Дата расчёта")),
+            ],
+            options={
+                "verbose_name": "Рейтинг поста",
+                "verbose_name_plural": "Рейтинги постов",
+                "indexes": [models.Index(fields=["-score", "-post"], name="trending_score_idx")],
+            },
+        ),
+    ]
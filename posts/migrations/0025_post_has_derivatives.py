@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0024_trendingscore"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="has_derivatives",
+            field=models.BooleanField(default=False, editable=False, verbose_name="Уменьшенные копии готовы"),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:00
+
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0025_post_has_derivatives"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=255, verbose_name="Файл в хранилище")),
+                ("size", models.PositiveBigIntegerField(verbose_name="Размер файла")),
+                ("sha256", models.CharField(max_length=64, verbose_name="Контрольная сумма SHA-256")),
+                ("received", models.PositiveBigIntegerField(default=0, verbose_name="Принято байт")),
+                ("completed", models.BooleanField(default=False, verbose_name="Загрузка завершена")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Дата начала")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="upload_sessions",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Автор",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Загрузка файла",
+                "verbose_name_plural": "Загрузки файлов",
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0026_uploadsession"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredFile",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=255, primary_key=True, serialize=False, verbose_name="Файл в хранилище"
+                    ),
+                ),
+                ("size", models.PositiveBigIntegerField(default=0, verbose_name="Размер файла")),
+                ("ref_count", models.PositiveIntegerField(default=0, verbose_name="Количество ссылок")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")),
+            ],
+            options={
+                "verbose_name": "Файл",
+                "verbose_name_plural": "Файлы",
+            },
+        ),
+        migrations.AlterField(
+            model_name="post",
+            name="file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=posts.storage.ContentAddressedStorage(),
+                upload_to="uploads/",
+                verbose_name="Медиафайлы",
+            ),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+from posts.metadata import extract_metadata
+
+METADATA_FIELDS = ["media_type", "mime_type", "file_size", "width", "height", "duration"]
+
+
+def fill_metadata(apps, schema_editor):
+    """Сведения о файлах существующих постов: читаются только заголовки файлов"""
+    Post = apps.get_model("posts", "Post")
+    posts = Post.objects.exclude(file="").exclude(file__isnull=True).only("pk", "file")
+    batch = []
+    for post in posts.iterator(chunk_size=500):
+        for field, value in extract_metadata(post.file).items():
+            setattr(post, field, value)
+        batch.append(post)
+        if len(batch) == 500:
+            Post.objects.bulk_update(batch, METADATA_FIELDS)
+            batch = []
+    Post.objects.bulk_update(batch, METADATA_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0027_storedfile_alter_post_file"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="media_type",
+            field=models.CharField(
+                blank=True,
+                choices=[("VIDEO", "Видео"), ("IMAGE", "Изображение")],
+                editable=False,
+                max_length=10,
+                verbose_name="Вид медиа",
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="mime_type",
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name="MIME-тип"),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="file_size",
+            field=models.PositiveBigIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Размер файла, байт"
+            ),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="width",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name="Ширина, пикселей"),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="height",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name="Высота, пикселей"),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="duration",
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name="Длительность, секунд"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["media_type", "-created_at", "-id"], name="post_media_feed_idx"),
+        ),
+        migrations.RunPython(fill_metadata, migrations.RunPython.noop),
+    ]
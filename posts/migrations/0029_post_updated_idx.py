@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0028_post_media_metadata"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["updated_at"], name="post_updated_idx"),
+        ),
+    ]
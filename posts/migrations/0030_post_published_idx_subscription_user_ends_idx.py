@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0029_post_updated_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(condition=models.Q(("public", True)), fields=["created_at"], name="post_published_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(fields=["user", "-ends_at"], name="subscription_user_ends_idx"),
+        ),
+    ]
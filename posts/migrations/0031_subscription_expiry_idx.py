@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0030_post_published_idx_subscription_user_ends_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="subscription",
+            name="subscription_user_ends_idx",
+        ),
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(
+                condition=models.Q(("active", True)), fields=["user", "-ends_at"], name="subscription_user_ends_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(
+                condition=models.Q(("active", True)), fields=["ends_at"], name="subscription_expiry_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0031_subscription_expiry_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="uploadsession",
+            name="sha256",
+            field=models.CharField(blank=True, max_length=64, verbose_name="Контрольная сумма SHA-256"),
+        ),
+    ]
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
+import uuid
 from datetime import timedelta
 
 from django.db import models
+from django.db.models.functions import Left
 from django.utils.timezone import now
 
+from posts.storage import content_storage
 from users.models import User
 
 
@@ -12,25 +15,83 @@ class MediaType(models.TextChoices):
     IMAGE = "IMAGE", "Изображение"
 
 
+EXCERPT_LENGTH = 100  # Сколько символов описания выводит карточка поста
+CARD_FIELDS = (
+    "id",
+    "title",
+    "file",
+    "media_type",
+    "mime_type",
+    "width",
+    "height",
+    "premium",
+    "author",
+    "has_derivatives",
+    "like_count",
+    "comment_count",
+    "created_at",
+    "updated_at",
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def cards(self):
+        """
+        Только колонки, которые выводят карточки и страница поста.
+        Описание целиком не загружается: в excerpt попадает начало, достаточное для truncatechars.
+        """
+        return self.only(*CARD_FIELDS).annotate(excerpt=Left("description", EXCERPT_LENGTH + 1))
+
+
 class Post(models.Model):
     title = models.CharField(max_length=255, verbose_name="Название поста")
     description = models.TextField(blank=True, verbose_name="Содержание поста")
     file = models.FileField(
-        upload_to="uploads/%Y/%m/%d/", blank=True, null=True, verbose_name="Медиафайлы"
-    )  # Загрузка медиафайлов
+        upload_to="uploads/", storage=content_storage, blank=True, null=True, verbose_name="Медиафайлы"
+    )  # Загрузка медиафайлов: имя по хешу содержимого, см. posts.storage
+    # Сведения о файле заполняются при его сохранении (posts.metadata), шаблоны читают их как обычные колонки
+    media_type = models.CharField(
+        max_length=10, choices=MediaType.choices, blank=True, editable=False, verbose_name="Вид медиа"
+    )
+    mime_type = models.CharField(max_length=100, blank=True, editable=False, verbose_name="MIME-тип")
+    file_size = models.PositiveBigIntegerField(
+        null=True, blank=True, editable=False, verbose_name="Размер файла, байт"
+    )
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Ширина, пикселей")
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Высота, пикселей")
+    duration = models.FloatField(null=True, blank=True, editable=False, verbose_name="Длительность, секунд")
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Автор")
     public = models.BooleanField(default=True, verbose_name="Публикация")  # Открытый доступ
     premium = models.BooleanField(default=False, verbose_name="Платный материал")  # Платный материал
+    has_derivatives = models.BooleanField(default=False, editable=False, verbose_name="Уменьшенные копии готовы")
     view_count = models.PositiveIntegerField(default=0, verbose_name="Счетчик просмотров")  # Счётчик просмотров
     likes = models.ManyToManyField(User, through="Like", related_name="liked_posts", verbose_name="Лайки")  # Лайки
+    like_count = models.PositiveIntegerField(default=0, verbose_name="Количество лайков")  # См. posts.services
+    comment_count = models.PositiveIntegerField(default=0, verbose_name="Количество комментариев")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    objects = PostQuerySet.as_manager()
 
     def increment_view_count(self):
-        self.view_count += 1
-        self.save(update_fields=["view_count"])
+        """Просмотр копится в буфере и попадает в view_count при очередном flush_view_counts"""
+        from posts.counters import get_view_counter
+
+        get_view_counter().increment(self.pk)
 
     class Meta:
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
+        indexes = [
+            # Ключ keyset-пагинации ленты: свежие сверху, pk разрешает совпадения
+            models.Index(fields=["-created_at", "-id"], name="post_feed_idx"),
+            # Лента с отбором по виду медиа (?media=video)
+            models.Index(fields=["media_type", "-created_at", "-id"], name="post_media_feed_idx"),
+            # Last-Modified ленты: Max(updated_at) читает край индекса (см. posts.views.feed_last_modified)
+            models.Index(fields=["updated_at"], name="post_updated_idx"),
+            # Окно популярного (posts.trending.stale_posts): неопубликованные посты в индекс не попадают
+            models.Index(fields=["created_at"], name="post_published_idx", condition=models.Q(public=True)),
+        ]
 
 
 class Like(models.Model):
@@ -41,22 +102,120 @@ class Like(models.Model):
     class Meta:
         verbose_name = "Лайк"
         verbose_name_plural = "Лайки"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "post"], name="unique_like"),
+        ]
+
+
+COMMENT_PATH_DIGITS = 10  # Ширина сегмента пути: id с ведущими нулями, чтобы строки сортировались как числа
+COMMENT_MAX_DEPTH = 8
 
 
 class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, null=True, blank=True, related_name="replies", verbose_name="Ответ на"
+    )
+    # Материализованный путь: id предков и самого комментария через точку ("0000000007.0000000012").
+    # Ветка целиком — комментарии поста с путём, начинающимся с пути корня; сортировка по пути даёт порядок обхода
+    path = models.CharField(max_length=255, editable=False, verbose_name="Путь в ветке")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Уровень вложенности")
     text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
+        indexes = [
+            # varchar_pattern_ops нужен PostgreSQL, чтобы path LIKE 'префикс%' шёл по индексу;
+            # другие СУБД классы операторов игнорируют
+            models.Index(
+                fields=["post", "path"], name="comment_thread_idx", opclasses=["int8_ops", "varchar_pattern_ops"]
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.email}: {self.text[:50]}"
 
 
+class SearchTerm(models.Model):
+    """Словарь слов из заголовков постов для автодополнения и подсказок «Возможно, вы имели в виду»"""
+
+    term = models.CharField(max_length=100, unique=True, verbose_name="Слово")
+    frequency = models.PositiveIntegerField(default=0, verbose_name="Количество постов")
+
+    class Meta:
+        verbose_name = "Поисковый термин"
+        verbose_name_plural = "Поисковые термины"
+
+    def __str__(self):
+        return self.term
+
+
+class TrendingScore(models.Model):
+    """
+    Материализованный рейтинг популярного (см. posts.trending). Счётчики поста на момент расчёта
+    хранятся рядом, чтобы пересчитывать только посты, у которых они изменились.
+    """
+
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True, related_name="trending", verbose_name="Пост"
+    )
+    score = models.FloatField(verbose_name="Рейтинг")
+    view_count = models.PositiveIntegerField(default=0, verbose_name="Просмотры при расчёте")
+    like_count = models.PositiveIntegerField(default=0, verbose_name="Лайки при расчёте")
+    comment_count = models.PositiveIntegerField(default=0, verbose_name="Комментарии при расчёте")
+    computed_at = models.DateTimeField(auto_now=True, verbose_name="Дата расчёта")
+
+    class Meta:
+        verbose_name = "Рейтинг поста"
+        verbose_name_plural = "Рейтинги постов"
+        indexes = [
+            # Страница популярного — чтение диапазона этого индекса
+            models.Index(fields=["-score", "-post"], name="trending_score_idx"),
+        ]
+
+
+class StoredFile(models.Model):
+    """Файл хранилища по содержимому (posts.storage) и число постов, которые на него ссылаются"""
+
+    name = models.CharField(max_length=255, primary_key=True, verbose_name="Файл в хранилище")
+    size = models.PositiveBigIntegerField(default=0, verbose_name="Размер файла")
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Количество ссылок")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
+
+    class Meta:
+        verbose_name = "Файл"
+        verbose_name_plural = "Файлы"
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+class UploadSession(models.Model):
+    """
+    Загрузка файла поста частями (см. posts.uploads). Части пишутся сразу в итоговый файл name,
+    received — сколько байт уже принято: с этого места клиент продолжает после обрыва.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions", verbose_name="Автор")
+    name = models.CharField(max_length=255, verbose_name="Файл в хранилище")
+    size = models.PositiveBigIntegerField(verbose_name="Размер файла")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="Контрольная сумма SHA-256")
+    received = models.PositiveBigIntegerField(default=0, verbose_name="Принято байт")
+    completed = models.BooleanField(default=False, verbose_name="Загрузка завершена")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата начала")
+
+    class Meta:
+        verbose_name = "Загрузка файла"
+        verbose_name_plural = "Загрузки файлов"
+
+    def __str__(self):
+        return f"{self.name} ({self.received}/{self.size})"
+
+
 class Subscription(models.Model):
     SUBSCRIPTION_CHOICES = (("SINGLE", "Разовая подписка"),)
 
@@ -72,6 +231,14 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
+        indexes = [
+            # Срок подписки пользователя (posts.entitlements): Max(ends_at) читается из индекса без таблицы
+            models.Index(
+                fields=["user", "-ends_at"], name="subscription_user_ends_idx", condition=models.Q(active=True)
+            ),
+            # Истёкшие, но ещё активные подписки для expire_subscriptions
+            models.Index(fields=["ends_at"], name="subscription_expiry_idx", condition=models.Q(active=True)),
+        ]
 
     def set_end_date(self):
         """
@@ -92,10 +259,10 @@ class Subscription(models.Model):
 
     def is_valid(self):
         """
-        Проверка активности подписки
+        Проверка активности подписки (как в posts.entitlements.get_entitlement)
         """
         now_time = now()
-        return self.ends_at > now_time if self.ends_at else False
+        return self.active and self.ends_at > now_time if self.ends_at else False
 
     def __str__(self):
         return f"{self.user.email} | Подписка до {self.ends_at.strftime('%Y-%m-%d')} | {'Активна' if self.is_valid() else 'Истекла'}"
@@ -0,0 +1,91 @@
+import re
+import unicodedata
+
+from posts.constants import FORBIDDEN_WORDS
+
+# Невидимые символы (мягкий перенос, пробелы нулевой ширины) и знаки ударения, которыми разбивают слово
+INVISIBLE_RE = re.compile("[\u00ad\u200b-\u200d\u2060\ufeff\u0300\u0301]")
+WORD_RE = re.compile(r"\w+")  # Знаки препинания — границы слов: "казино!" даёт слово "казино"
+CYRILLIC_RE = re.compile("[а-я]")
+# Латинские буквы, которые выглядят как кириллические: "kaзинo" в слове с кириллицей читается как "казино"
+HOMOGLYPHS = str.maketrans("aeopcxykmtbh", "аеорсхукмтвн")
+# Окончания существительных, прилагательных и наречий: слово запрещено во всех формах ("казино", "биржи", "обманом")
+ENDINGS = frozenset(
+    [
+        "",
+        *"аяоеиыуюьй",
+        *["ам", "ям", "ами", "ями", "ах", "ях", "ом", "ем", "ой", "ей", "ою", "ею", "ов", "ев", "ий", "ый", "ия"],
+        *["ие", "ии", "ию", "ье", "ья", "ьи", "ью", "ьям", "ьями", "ьях", "ьем", "ией", "иям", "иями", "иях"],
+        *["ая", "яя", "ое", "ее", "ые", "ого", "его", "ому", "ему", "ым", "им", "ых", "их", "ую", "юю"],
+    ]
+)
+MIN_STEM_LENGTH = 3  # Короче основа совпадала бы с началом безобидных слов
+
+
+def normalize_word(word):
+    """Слово в виде для сравнения: совместимая форма Unicode, без регистра, "ё" как "е", без латинских двойников"""
+    word = unicodedata.normalize("NFKC", word).casefold().replace("ё", "е")
+    if CYRILLIC_RE.search(word):
+        word = word.translate(HOMOGLYPHS)
+    return word
+
+
+def word_stem(word):
+    """Основа слова: без самого длинного из окончаний ENDINGS, которое оставляет не меньше MIN_STEM_LENGTH букв"""
+    for length in range(len(word) - MIN_STEM_LENGTH, 0, -1):
+        if word[-length:] in ENDINGS:
+            return word[:-length]
+    return word
+
+
+class ForbiddenWordMatcher:
+    """
+    Список запрещённых слов, собранный один раз в префиксное дерево основ.
+    Слово текста проходит по дереву от первой буквы; если на пройденном пути кончается основа запрещённого
+    слова, а остаток — допустимое окончание, слово запрещено. Каждая буква текста читается один раз,
+    поэтому проверка линейна по длине текста и не зависит от размера списка.
+    """
+
+    def __init__(self, words):
+        self._root = {}
+        for word in words:
+            node = self._root
+            for char in word_stem(normalize_word(word)):
+                node = node.setdefault(char, {})
+            node.setdefault(None, word)  # Ключ None — конец основы; значение — запрещённое слово из списка
+
+    def match_word(self, word):
+        """Запрещённое слово из списка, формой которого является word, или None"""
+        node = self._root
+        for position, char in enumerate(word):
+            if None in node and word[position:] in ENDINGS:
+                return node[None]
+            node = node.get(char)
+            if node is None:
+                return None
+        return node.get(None)
+
+    def find(self, text):
+        """Пары (слово как в тексте, запрещённое слово из списка) в порядке появления"""
+        matches = []
+        for word in WORD_RE.findall(INVISIBLE_RE.sub("", text or "")):
+            forbidden = self.match_word(normalize_word(word))
+            if forbidden is not None:
+                matches.append((word, forbidden))
+        return matches
+
+
+forbidden_words = ForbiddenWordMatcher(FORBIDDEN_WORDS)
+
+
+def scan_posts(rows):
+    """
+    Проверка пачки постов (pk, заголовок, описание) для rescan_forbidden_words; выполняется в процессах пула.
+    Возвращает пары (pk, найденные слова) только для постов с совпадениями.
+    """
+    found = []
+    for pk, title, description in rows:
+        matches = forbidden_words.find(title) + forbidden_words.find(description)
+        if matches:
+            found.append((pk, sorted({word for word, _ in matches})))
+    return found
@@ -0,0 +1,213 @@
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.backends.utils import csrf_input
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.html import escape
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+
+from posts.counters import get_view_counter
+from posts.models import Like, Post
+
+PAGE_CACHE_TIMEOUT = 60 * 5
+PAGE_CACHE_KEY = "page:2:{audience}:{versions}:{digest}"  # 2 — формат записи (содержимое, тип, время изменения)
+PAGE_VERSION_KEY = "page:version:{scope}"
+# "Дырки" в закешированной странице: данные, которые различаются у посетителей одной аудитории
+# или меняются чаще страницы. В кеше хранится метка, значение подставляется при каждой отдаче
+PAGE_HOLE_MARKER = "<!--page-cache:{name}:{arg}-->"
+PAGE_HOLE_RE = re.compile(rb"<!--page-cache:(\w+):(\w*)-->")
+# Счётчик лайков для «дырок»: сбрасывается при лайке, а срок ограничивает устаревание при гонке с ним
+LIKE_COUNT_KEY = "page:like_count:{pk}"
+
+
+def page_audience(request):
+    """Аудитория страницы: аноним, авторизованный без подписки или подписчик"""
+    if not request.user.is_authenticated:
+        return "anonymous"
+    if request.entitlement.is_subscriber:
+        return "subscriber"
+    return "member"
+
+
+def mark_private(request):
+    """Страница содержит данные конкретного пользователя и не должна попадать в общий кеш"""
+    request.page_cache_private = True
+
+
+def invalidate_pages(*scopes):
+    """Новая версия областей: все страницы, закешированные с этими областями, устаревают"""
+    cache.set_many({PAGE_VERSION_KEY.format(scope=scope): time.time_ns() for scope in scopes}, None)
+
+
+def invalidate_like_count(pk):
+    cache.delete(LIKE_COUNT_KEY.format(pk=pk))
+
+
+def _scope_versions(scopes):
+    keys = [PAGE_VERSION_KEY.format(scope=scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _etag(request, audience, versions, digest):
+    """
+    ETag страницы без её рендеринга и без запросов к БД. Страница меняется вместе с версиями областей,
+    а «дырки» — с посетителем: пользователем, его лайками (область likes:<id>) и CSRF-cookie.
+    Счётчики просмотров и лайков в ETag не входят: иначе любой просмотр или лайк в ленте менял бы его
+    у всех посетителей и 304 почти не случался бы; свежие значения подставляются при полной отдаче страницы.
+    """
+    personal = [request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")]
+    if request.user.is_authenticated:
+        personal += _scope_versions([f"likes:{request.user.pk}"])
+    parts = [audience, digest, *versions, *personal]
+    return f'W/"{hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()}"'
+
+
+def _last_modified(versions, modified_at):
+    """Лайки и комментарии меняют страницу, не трогая updated_at, — учитываем и время версий областей"""
+    return int(max([modified_at.timestamp() if modified_at else 0, *(version / 1e9 for version in versions)]))
+
+
+def _is_cacheable(request, response):
+    return (
+        response.status_code == 200
+        and not response.cookies
+        and not getattr(request, "page_cache_private", False)
+        # Страница с CSRF-токеном (формой) привязана к cookie конкретного посетителя
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+        and "private" not in response.get("Cache-Control", "")
+    )
+
+
+def _user_email(request, args):
+    email = escape(getattr(request.user, "email", None) or "")
+    return dict.fromkeys(args, email)
+
+
+def _view_count(request, pks):
+    counter = get_view_counter()
+    return {pk: str(counter.count(int(pk))) for pk in pks}
+
+
+def _like_count(request, pks):
+    keys = {pk: LIKE_COUNT_KEY.format(pk=pk) for pk in pks}
+    cached = cache.get_many(keys.values())
+    missing = [int(pk) for pk, key in keys.items() if key not in cached]
+    if missing:
+        counts = dict(Post.objects.filter(pk__in=missing).values_list("pk", "like_count"))
+        fetched = {keys[str(pk)]: counts.get(pk, 0) for pk in missing}
+        cache.set_many(fetched, PAGE_CACHE_TIMEOUT)
+        cached.update(fetched)
+    return {pk: str(cached[key]) for pk, key in keys.items()}
+
+
+def _liked(request, pks):
+    liked = set()
+    if request.user.is_authenticated:
+        liked = set(Like.objects.filter(user=request.user, post__in=pks).values_list("post_id", flat=True))
+    return {pk: "active" if int(pk) in liked else "" for pk in pks}
+
+
+def _csrf_input(request, args):
+    # Токен выдаётся уже при отдаче страницы, поэтому форма не мешает кешировать её для всей аудитории
+    return dict.fromkeys(args, csrf_input(request))
+
+
+# Заполнители получают все аргументы меток одного вида сразу, чтобы обойтись одним запросом на страницу
+PAGE_HOLES = {
+    "user_email": _user_email,
+    "view_count": _view_count,
+    "like_count": _like_count,
+    "liked": _liked,
+    "csrf_input": _csrf_input,
+}
+
+
+def page_hole(request, name, arg, value):
+    """Значение для шаблона: метка, если страница уйдёт в кеш, иначе само значение (вычисляется лениво)"""
+    if getattr(request, "page_cache_personalize", False):
+        return mark_safe(PAGE_HOLE_MARKER.format(name=name, arg=arg))
+    return value()
+
+
+def _personalize(content, request):
+    holes = {}
+    for name, arg in PAGE_HOLE_RE.findall(content):
+        holes.setdefault(name.decode(), set()).add(arg.decode())
+    values = {name: PAGE_HOLES[name](request, sorted(args)) for name, args in holes.items()}
+    return PAGE_HOLE_RE.sub(lambda match: values[match.group(1).decode()][match.group(2).decode()].encode(), content)
+
+
+def cache_page_for_audience(*scopes, timeout=PAGE_CACHE_TIMEOUT, last_modified=None):
+    """
+    Кеш готовых страниц по URL и аудитории посетителя.
+    Области (например "feed" или "post:{pk}") подставляют аргументы URL; их версии входят в ключ,
+    поэтому invalidate_pages("post:5") сбрасывает ровно страницы, зависящие от поста 5.
+    Персонал не кешируется: он видит кнопки управления чужими постами.
+
+    С last_modified(**kwargs) — время изменения содержимого по индексу, без рендеринга — страница
+    получает ETag и Last-Modified, и повторный запрос неизменившейся страницы получает 304.
+    Время запрашивается только при промахе кеша и хранится рядом со страницей.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or request.user.is_staff:
+                return view(request, *args, **kwargs)
+
+            audience = page_audience(request)
+            versions = _scope_versions([scope.format(**kwargs) for scope in scopes])
+            digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            etag = None
+            if last_modified is not None:
+                etag = _etag(request, audience, versions, digest)
+                # Время изменения из БД нужно, только если браузер прислал одну дату без ETag
+                modified_since = None
+                if "HTTP_IF_MODIFIED_SINCE" in request.META and "HTTP_IF_NONE_MATCH" not in request.META:
+                    modified_since = _last_modified(versions, last_modified(**kwargs))
+                not_modified = get_conditional_response(request, etag, modified_since)
+                if not_modified is not None:
+                    patch_vary_headers(not_modified, ["Cookie"])
+                    return not_modified
+
+            key = PAGE_CACHE_KEY.format(audience=audience, versions=".".join(map(str, versions)), digest=digest)
+            entry = cache.get(key)
+            if entry is not None:
+                content, content_type, modified_at = entry
+                response = HttpResponse(_personalize(content, request), content_type=content_type)
+                response["X-Page-Cache"] = "hit"
+            else:
+                # До рендеринга: время не может оказаться новее содержимого страницы
+                modified_at = last_modified(**kwargs) if last_modified is not None else None
+                request.page_cache_personalize = True
+                response = view(request, *args, **kwargs)
+                if hasattr(response, "render") and callable(response.render):
+                    response.render()
+                if not response.streaming:
+                    if _is_cacheable(request, response):
+                        cache.set(key, (response.content, response["Content-Type"], modified_at), timeout)
+                        response["X-Page-Cache"] = "miss"
+                    response.content = _personalize(response.content, request)
+
+            if etag is not None and response.status_code == 200:
+                response["ETag"] = etag
+                response["Last-Modified"] = http_date(_last_modified(versions, modified_at))
+                # Браузер хранит страницу, но каждый раз сверяется с сервером: дешёвый 304 вместо рендеринга
+                patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ["Cookie"])
+            return response
+
+        return wrapper
+
+    return decorator
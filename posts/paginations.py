@@ -1,6 +1,263 @@
-from django.core.paginator import Paginator
+import base64
+import json
+from collections.abc import Sequence
+from datetime import datetime
+from math import ceil
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Ниже этого порога планировщик часто ошибается, а точный COUNT(*) ещё дешёвый
+EXACT_COUNT_THRESHOLD = 10000
 
 
 class CustomPagination(Paginator):
     def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True):
         super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+
+
+def estimated_count(queryset):
+    """
+    Оценка количества строк выборки по статистике планировщика PostgreSQL.
+    Для небольших выборок и других СУБД выполняется точный подсчёт.
+    """
+    return count_estimate(queryset)[0]
+
+
+def count_estimate(queryset):
+    """Пара (количество строк, точное ли оно) — см. estimated_count"""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count(), True
+
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]["Plan"]["Plan Rows"])
+
+    if estimate < EXACT_COUNT_THRESHOLD:
+        return queryset.count(), True
+    return estimate, False
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPage(Sequence):
+    """Страница курсорной пагинации с непрозрачными токенами соседних страниц"""
+
+    def __init__(self, object_list, number, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<Page {self.number} of {self.paginator.num_pages}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset-пагинация: вместо OFFSET страница выбирается условием по ключу сортировки
+    последней (или первой) записи предыдущей страницы, поэтому глубокие страницы
+    стоят столько же, сколько первая. Общее количество страниц оценочное.
+    Последняя страница строится по остатку от деления количества на размер страницы, поэтому
+    переход на неё (курсор "last") есть, только пока количество точное: по оценке страницы разошлись бы.
+    """
+
+    FIRST = "first"
+    LAST = "last"
+
+    def __init__(self, queryset, per_page, ordering=("-created_at", "-pk")):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip("-") for field in self.ordering]
+
+    @cached_property
+    def _count(self):
+        return count_estimate(self.queryset)
+
+    @property
+    def count(self):
+        return self._count[0]
+
+    @property
+    def has_exact_count(self):
+        return self._count[1]
+
+    @cached_property
+    def num_pages(self):
+        return max(1, ceil(self.count / self.per_page))
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def encode_cursor(self, direction, values, number):
+        payload = {"d": direction, "v": [self._dump(value) for value in values], "n": number}
+        raw = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        if cursor == self.LAST and not self.has_exact_count:
+            raise InvalidCursor("Последняя страница недоступна: количество записей оценочное")
+        if cursor in (self.FIRST, self.LAST):
+            return cursor, None, 1 if cursor == self.FIRST else self.num_pages
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            direction, values, number = payload["d"], payload["v"], int(payload["n"])
+            if direction not in ("next", "prev") or len(values) != len(self.fields):
+                raise ValueError(direction)
+            values = [self._clean(field, self._load(value)) for field, value in zip(self.fields, values)]
+        except (ValueError, KeyError, TypeError, ValidationError):
+            raise InvalidCursor("Некорректный курсор страницы")
+        return direction, values, max(number, 1)
+
+    def page(self, cursor=None):
+        direction, values, number = self.decode_cursor(cursor or self.FIRST)
+
+        if direction in ("prev", self.LAST):
+            queryset = self.queryset.order_by(*self._reversed_ordering())
+            if values is not None:
+                queryset = queryset.filter(self._keyset_filter(values, reverse=True))
+            # Последняя страница неполная: её размер берётся из (оценочного) количества строк
+            size = self.per_page if direction == "prev" else self.count % self.per_page or self.per_page
+            rows = list(queryset[: size + 1])
+            has_more = len(rows) > size
+            rows = rows[:size][::-1]
+            has_next = direction == "prev"
+            has_previous = has_more
+        else:
+            queryset = self.queryset.order_by(*self.ordering)
+            if values is not None:
+                queryset = queryset.filter(self._keyset_filter(values))
+            rows = list(queryset[: self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[: self.per_page]
+            has_next = has_more
+            has_previous = direction == "next"
+
+        if direction == self.LAST and not has_previous:
+            number = 1
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor("next", self._key(rows[-1]), number + 1)
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor("prev", self._key(rows[0]), max(number - 1, 1))
+        return CursorPage(rows, number, self, next_cursor, previous_cursor)
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith("-") else f"-{field}" for field in self.ordering]
+
+    def _keyset_filter(self, values, reverse=False):
+        """
+        Лексикографическое сравнение по ключу сортировки:
+        (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+            step = Q(**{f"{self.fields[index]}__{lookup}": values[index]})
+            for prev_field, prev_value in zip(self.fields[:index], values[:index]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def _key_field(self, name):
+        if name == "pk":
+            return self.queryset.model._meta.pk
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def _clean(self, name, value):
+        """Значение ключа из курсора, приведённое к типу поля сортировки; чужой тип — ошибка"""
+        if value is None or isinstance(value, (bool, list, dict)):
+            raise TypeError(name)
+        return self._key_field(name).to_python(value)
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, datetime):
+            return {"dt": value.isoformat()}
+        return value
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, dict) and "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        return value
+
+
+class SequenceCursorPaginator(CursorPaginator):
+    """
+    Та же курсорная пагинация для готового упорядоченного списка (например, id результатов поиска):
+    курсор хранит позицию в списке, а количество страниц точное.
+    """
+
+    has_exact_count = True
+
+    def __init__(self, sequence, per_page):
+        super().__init__(None, per_page, ordering=("position",))
+        self.sequence = sequence
+
+    @cached_property
+    def count(self):
+        return len(self.sequence)
+
+    def _clean(self, name, value):
+        """Позиция в списке: только неотрицательное целое (bool — тоже int в Python, но не позиция)"""
+        if type(value) is not int or value < 0:
+            raise TypeError(name)
+        return value
+
+    def page(self, cursor=None):
+        direction, values, number = self.decode_cursor(cursor or self.FIRST)
+        if direction == self.FIRST:
+            start = 0
+        elif direction == self.LAST:
+            start = (self.num_pages - 1) * self.per_page
+        elif direction == "next":
+            start = values[0] + 1
+        else:
+            start = max(values[0] - self.per_page, 0)
+        if start == 0:
+            number = 1
+
+        stop = start + self.per_page
+        rows = self.sequence[start:stop]
+        end = start + len(rows)
+        next_cursor = self.encode_cursor("next", [end - 1], number + 1) if rows and end < self.count else None
+        previous_cursor = self.encode_cursor("prev", [start], number - 1) if start > 0 else None
+        return CursorPage(rows, number, self, next_cursor, previous_cursor)
@@ -0,0 +1,306 @@
+import difflib
+import hashlib
+import re
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.functions import Length
+
+from posts.models import Post, SearchTerm
+
+SEARCH_RESULTS_LIMIT = 1000  # Больше результатов по одному запросу никто не листает
+MAX_SEARCH_TERMS = 10
+TERM_RE = re.compile(r"\w+")
+
+SUGGESTIONS_LIMIT = 8
+SUGGEST_MIN_PREFIX = 2
+SUGGEST_CACHE_TIMEOUT = 60 * 5
+SUGGEST_CACHE_KEY = "search:suggest:{digest}"
+RESULTS_CACHE_TIMEOUT = 60
+RESULTS_CACHE_KEY = "search:results:{vendor}:{digest}"
+RESULTS_VERSION_KEY = "search:results:version"
+MAX_TERM_LENGTH = SearchTerm._meta.get_field("term").max_length
+
+
+def search_terms(query):
+    """Слова запроса в нижнем регистре, без знаков препинания и операторов поискового синтаксиса"""
+    return TERM_RE.findall(query.lower())[:MAX_SEARCH_TERMS]
+
+
+def title_terms(title):
+    """Слова заголовка, которые попадают в словарь SearchTerm"""
+    return {term for term in TERM_RE.findall(title.lower()) if SUGGEST_MIN_PREFIX <= len(term) <= MAX_TERM_LENGTH}
+
+
+def update_search_terms(old_title, new_title):
+    """Поправка частот словаря при создании, переименовании или удалении поста"""
+    old_terms, new_terms = title_terms(old_title or ""), title_terms(new_title or "")
+    added, removed = new_terms - old_terms, old_terms - new_terms
+    if added:
+        SearchTerm.objects.bulk_create([SearchTerm(term=term) for term in added], ignore_conflicts=True)
+        SearchTerm.objects.filter(term__in=added).update(frequency=F("frequency") + 1)
+    if removed:
+        SearchTerm.objects.filter(term__in=removed, frequency__gt=0).update(frequency=F("frequency") - 1)
+        SearchTerm.objects.filter(term__in=removed, frequency=0).delete()
+
+
+def invalidate_search_results():
+    """Все закешированные выдачи поиска устаревают (новая версия ключей)"""
+    try:
+        cache.incr(RESULTS_VERSION_KEY)
+    except ValueError:
+        cache.set(RESULTS_VERSION_KEY, 1, None)
+
+
+def count_title_terms(titles):
+    """Частоты слов по заголовкам: сколько постов содержит каждое слово"""
+    counter = Counter()
+    for title in titles:
+        counter.update(title_terms(title))
+    return counter
+
+
+class SearchEngine:
+    """Поиск подстрокой (icontains) — запасной вариант для СУБД без полнотекстового поиска"""
+
+    INSTALL_SQL = []
+    UNINSTALL_SQL = []
+    SUGGEST_INSTALL_SQL = []
+    SUGGEST_UNINSTALL_SQL = []
+    reinstall_after_migrate = False
+    # Кандидаты для подсказки сравниваются в Python, поэтому их число ограничено
+    CLOSEST_TERM_CANDIDATES = 500
+
+    def install(self, connection):
+        """Создание служебных структур поиска (колонки, индексы, триггеры)"""
+        self._execute(connection, self.INSTALL_SQL)
+
+    def uninstall(self, connection):
+        self._execute(connection, self.UNINSTALL_SQL)
+
+    def install_suggestions(self, connection):
+        """Индексы словаря SearchTerm для автодополнения и поиска похожих слов"""
+        self._execute(connection, self.SUGGEST_INSTALL_SQL)
+
+    def uninstall_suggestions(self, connection):
+        self._execute(connection, self.SUGGEST_UNINSTALL_SQL)
+
+    @staticmethod
+    def _execute(connection, statements):
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def search_ids(self, query, limit=SEARCH_RESULTS_LIMIT):
+        """id найденных постов, самые релевантные первыми"""
+        return list(
+            Post.objects.filter(Q(title__icontains=query) | Q(description__icontains=query))
+            .order_by("-created_at", "-pk")
+            .values_list("pk", flat=True)[:limit]
+        )
+
+    def search(self, query, limit=SEARCH_RESULTS_LIMIT):
+        """Карточки найденных постов в порядке релевантности"""
+        return self.load(self.search_ids(query, limit))
+
+    def load(self, ids):
+        """Карточки постов по списку id с сохранением порядка (удалённые посты пропускаются)"""
+        posts = Post.objects.cards().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+    def cached_search_ids(self, query):
+        """
+        id результатов из кеша по нормализованному запросу.
+        Версия в ключе увеличивается при изменении постов, и все сохранённые выдачи устаревают разом.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+        version = cache.get_or_set(RESULTS_VERSION_KEY, 1, None)
+        vendor = connections[Post.objects.db].vendor
+        key = RESULTS_CACHE_KEY.format(vendor=vendor, digest=hashlib.md5(" ".join(terms).encode()).hexdigest())
+        ids = cache.get(key, version=version)
+        if ids is None:
+            ids = self.search_ids(query)
+            cache.set(key, ids, RESULTS_CACHE_TIMEOUT, version=version)
+        return ids
+
+    def complete(self, query, limit=SUGGESTIONS_LIMIT):
+        """Варианты запроса: последнее слово дополняется самыми частыми словами из заголовков"""
+        terms = search_terms(query)
+        if not terms or len(terms[-1]) < SUGGEST_MIN_PREFIX:
+            return []
+
+        key = SUGGEST_CACHE_KEY.format(digest=hashlib.md5(" ".join(terms).encode()).hexdigest())
+        suggestions = cache.get(key)
+        if suggestions is None:
+            *head, prefix = terms
+            completions = (
+                SearchTerm.objects.filter(term__startswith=prefix)
+                .order_by("-frequency", "term")
+                .values_list("term", flat=True)[:limit]
+            )
+            suggestions = [" ".join([*head, term]) for term in completions]
+            cache.set(key, suggestions, SUGGEST_CACHE_TIMEOUT)
+        return suggestions
+
+    def closest_term(self, word):
+        """Ближайшее по написанию слово словаря (та же первая буква, похожая длина)"""
+        candidates = (
+            SearchTerm.objects.annotate(length=Length("term"))
+            .filter(term__startswith=word[0], length__range=(len(word) - 2, len(word) + 2))
+            .order_by("-frequency")
+            .values_list("term", flat=True)[: self.CLOSEST_TERM_CANDIDATES]
+        )
+        matches = difflib.get_close_matches(word, list(candidates), n=1, cutoff=0.7)
+        return matches[0] if matches else None
+
+    def did_you_mean(self, query):
+        """Исправленный запрос, если в нём есть слова, которых нет в словаре, иначе None"""
+        terms = search_terms(query)
+        known = set(SearchTerm.objects.filter(term__in=terms).values_list("term", flat=True))
+        corrected = [term if term in known else self.closest_term(term) or term for term in terms]
+        return " ".join(corrected) if corrected != terms else None
+
+
+class PostgresSearchEngine(SearchEngine):
+    """
+    Полнотекстовый поиск PostgreSQL: tsvector хранится в генерируемой колонке с GIN-индексом,
+    заголовок весит больше описания (A против B), результаты сортируются по ts_rank.
+    Конфигурация russian стеммит кириллицу русским словарём, а латиницу — английским.
+    """
+
+    INSTALL_SQL = [
+        """
+        ALTER TABLE posts_post ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+        ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS posts_post_search_vector_gin ON posts_post USING gin (search_vector)",
+    ]
+    UNINSTALL_SQL = [
+        "DROP INDEX IF EXISTS posts_post_search_vector_gin",
+        "ALTER TABLE posts_post DROP COLUMN IF EXISTS search_vector",
+    ]
+    SUGGEST_INSTALL_SQL = [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        # Префиксный LIKE использует B-tree только с pattern_ops при любой локали базы
+        "CREATE INDEX IF NOT EXISTS posts_searchterm_term_prefix ON posts_searchterm (term varchar_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS posts_searchterm_term_trgm ON posts_searchterm USING gin (term gin_trgm_ops)",
+    ]
+    SUGGEST_UNINSTALL_SQL = [
+        "DROP INDEX IF EXISTS posts_searchterm_term_prefix",
+        "DROP INDEX IF EXISTS posts_searchterm_term_trgm",
+    ]
+    CLOSEST_TERM_SQL = """
+        SELECT term FROM posts_searchterm
+        WHERE term %% %s
+        ORDER BY similarity(term, %s) DESC, frequency DESC
+        LIMIT 1
+    """
+    SEARCH_SQL = """
+        SELECT id FROM posts_post, to_tsquery('russian', %s) AS query
+        WHERE search_vector @@ query
+        ORDER BY ts_rank(search_vector, query) DESC, id DESC
+        LIMIT %s
+    """
+
+    def search_ids(self, query, limit=SEARCH_RESULTS_LIMIT):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # Каждое слово ищется как префикс, чтобы «Перв» находил «Первый»
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        with connections[Post.objects.db].cursor() as cursor:
+            cursor.execute(self.SEARCH_SQL, [tsquery, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def closest_term(self, word):
+        """Похожее слово по триграммам (оператор % использует GIN-индекс pg_trgm)"""
+        with connections[SearchTerm.objects.db].cursor() as cursor:
+            cursor.execute(self.CLOSEST_TERM_SQL, [word, word])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+
+class SqliteSearchEngine(SearchEngine):
+    """
+    Полнотекстовый поиск SQLite (FTS5) для разработки и тестов.
+    Индекс posts_post_fts поддерживается триггерами, ранжирование — bm25 с большим весом заголовка.
+    Стемминга нет, поэтому слова ищутся по префиксу.
+    """
+
+    # Миграции SQLite пересоздают таблицу posts_post и теряют триггеры, их нужно восстанавливать
+    reinstall_after_migrate = True
+
+    INSTALL_SQL = [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts
+        USING fts5(title, description, content='posts_post', content_rowid='id')
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert AFTER INSERT ON posts_post BEGIN
+            INSERT INTO posts_post_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete AFTER DELETE ON posts_post BEGIN
+            INSERT INTO posts_post_fts(posts_post_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_update AFTER UPDATE OF title, description ON posts_post BEGIN
+            INSERT INTO posts_post_fts(posts_post_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO posts_post_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+        """,
+        # Строки, записанные без триггеров, попадают в индекс при полной перестройке
+        "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')",
+    ]
+    UNINSTALL_SQL = [
+        "DROP TRIGGER IF EXISTS posts_post_fts_insert",
+        "DROP TRIGGER IF EXISTS posts_post_fts_delete",
+        "DROP TRIGGER IF EXISTS posts_post_fts_update",
+        "DROP TABLE IF EXISTS posts_post_fts",
+    ]
+    SEARCH_SQL = """
+        SELECT rowid FROM posts_post_fts
+        WHERE posts_post_fts MATCH %s
+        ORDER BY bm25(posts_post_fts, 10.0, 1.0), rowid DESC
+        LIMIT %s
+    """
+
+    def search_ids(self, query, limit=SEARCH_RESULTS_LIMIT):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+        with connections[Post.objects.db].cursor() as cursor:
+            cursor.execute(self.SEARCH_SQL, [match, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+SEARCH_ENGINES = {
+    "postgresql": PostgresSearchEngine,
+    "sqlite": SqliteSearchEngine,
+}
+
+
+def get_search_engine(connection=None):
+    """Поисковый движок для СУБД, в которой хранятся посты"""
+    connection = connection or connections[Post.objects.db]
+    return SEARCH_ENGINES.get(connection.vendor, SearchEngine)()
+
+
+def reinstall_search_index(sender, using, **kwargs):
+    """Обработчик post_migrate: восстанавливает структуры поиска, которые теряются при миграциях"""
+    connection = connections[using]
+    engine = get_search_engine(connection)
+    if engine.reinstall_after_migrate and "posts_post" in connection.introspection.table_names():
+        engine.install(connection)
@@ -0,0 +1,157 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+from posts.images import delete_derivatives
+from posts.models import COMMENT_MAX_DEPTH, COMMENT_PATH_DIGITS, Comment, Like, Post, StoredFile
+from posts.page_cache import invalidate_like_count, invalidate_pages
+from posts.paginations import CursorPaginator
+from posts.storage import content_storage, is_content_name
+
+COMMENT_THREADS_PER_PAGE = 10
+
+
+def like_post(user, post_id):
+    """
+    Ставит лайк. Повторный лайк отсекает уникальное ограничение (user, post),
+    поэтому счётчик увеличивается ровно один раз даже при одновременных запросах.
+    Возвращает True, если лайк добавлен.
+    """
+    try:
+        with transaction.atomic():
+            Like.objects.create(user=user, post_id=post_id)
+            Post.objects.filter(pk=post_id).update(like_count=F("like_count") + 1)
+    except IntegrityError:
+        return False
+    # Сам счётчик в закешированных страницах — «дырка» (posts.page_cache), ленту сбрасывать не нужно
+    invalidate_pages(f"post:{post_id}", f"likes:{user.pk}")
+    invalidate_like_count(post_id)
+    return True
+
+
+def unlike_post(user, post_id):
+    """Снимает лайк; счётчик уменьшается, только если лайк действительно был удалён"""
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(user=user, post_id=post_id).delete()
+        if deleted:
+            Post.objects.filter(pk=post_id).update(like_count=F("like_count") - 1)
+    if deleted:
+        invalidate_pages(f"post:{post_id}", f"likes:{user.pk}")
+        invalidate_like_count(post_id)
+    return bool(deleted)
+
+
+def toggle_like(user, post_id):
+    """Переключает лайк. Возвращает пару (стоит ли теперь лайк, количество лайков поста)"""
+    if Like.objects.filter(user=user, post_id=post_id).exists():
+        unlike_post(user, post_id)
+        liked = False
+    else:
+        like_post(user, post_id)
+        liked = True
+    like_count = Post.objects.filter(pk=post_id).values_list("like_count", flat=True).get()
+    return liked, like_count
+
+
+def liked_post_ids(user, posts):
+    """Какие из постов пользователь уже лайкнул — одним запросом на всю страницу"""
+    if not user.is_authenticated or not posts:
+        return set()
+    return set(Like.objects.filter(user=user, post__in=[post.pk for post in posts]).values_list("post_id", flat=True))
+
+
+def create_comment(user, post_id, text, parent=None):
+    """
+    Добавляет комментарий или ответ. Ответы глубже COMMENT_MAX_DEPTH прикрепляются
+    к родителю комментария, на который отвечают, чтобы путь не рос бесконечно.
+    """
+    if parent is not None and parent.depth + 1 >= COMMENT_MAX_DEPTH:
+        parent = parent.parent
+    with transaction.atomic():
+        comment = Comment.objects.create(
+            user=user, post_id=post_id, text=text, parent=parent, depth=parent.depth + 1 if parent else 0
+        )
+        segment = f"{comment.pk:0{COMMENT_PATH_DIGITS}d}"
+        comment.path = f"{parent.path}.{segment}" if parent else segment
+        comment.save(update_fields=["path"])
+        Post.objects.filter(pk=post_id).update(comment_count=F("comment_count") + 1)
+    invalidate_pages(f"post:{post_id}")
+    return comment
+
+
+def delete_comment(comment):
+    """Удаляет комментарий вместе со всеми ответами"""
+    with transaction.atomic():
+        deleted, _ = Comment.objects.filter(post_id=comment.post_id, path__startswith=comment.path).delete()
+        Post.objects.filter(pk=comment.post_id).update(comment_count=F("comment_count") - deleted)
+    invalidate_pages(f"post:{comment.post_id}")
+    return deleted
+
+
+def comment_threads(post, cursor=None, per_page=COMMENT_THREADS_PER_PAGE):
+    """
+    Страница веток комментариев поста: корневые комментарии листаются курсором по пути,
+    а ответы всех веток страницы загружаются одним запросом по префиксам путей.
+    В object_list страницы — комментарии в порядке обхода дерева, с depth для отступов.
+    """
+    roots = Comment.objects.filter(post=post, parent=None).select_related("user")
+    page = CursorPaginator(roots, per_page, ordering=("path",)).page(cursor)
+    if not page.object_list:
+        return page
+
+    prefixes = Q()
+    for root in page.object_list:
+        prefixes |= Q(path__startswith=f"{root.path}.")
+    replies = Comment.objects.filter(prefixes, post=post).select_related("user").order_by("path")
+
+    children = {}
+    for reply in replies:
+        children.setdefault(reply.path.split(".", 1)[0], []).append(reply)
+    page.object_list = [comment for root in page.object_list for comment in [root, *children.get(root.path, [])]]
+    return page
+
+
+def retain_file(name):
+    """Пост стал ссылаться на файл хранилища"""
+    _, created = StoredFile.objects.get_or_create(
+        name=name, defaults={"ref_count": 1, "size": content_storage.size(name) if content_storage.exists(name) else 0}
+    )
+    if not created:
+        StoredFile.objects.filter(name=name).update(ref_count=F("ref_count") + 1)
+
+
+def release_file(name):
+    """
+    Пост перестал ссылаться на файл. Файл без ссылок удаляется вместе с уменьшенными копиями
+    после коммита, чтобы откат транзакции не оставил пост без файла.
+    """
+    StoredFile.objects.filter(name=name, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+    if not StoredFile.objects.filter(name=name, ref_count=0).delete()[0]:
+        return
+
+    def remove():
+        content_storage.delete(name)
+        delete_derivatives(name)
+
+    transaction.on_commit(remove)
+
+
+def recount_file_references():
+    """Пересчитывает ссылки на файлы хранилища по постам целиком. Возвращает число файлов с постами"""
+    references = (
+        Post.objects.exclude(file="")
+        .exclude(file__isnull=True)
+        .values_list("file")
+        .annotate(refs=Count("pk"))
+        .order_by()
+    )
+    stored = [
+        StoredFile(name=name, ref_count=refs, size=content_storage.size(name))
+        for name, refs in references
+        if is_content_name(name) and content_storage.exists(name)
+    ]
+    with transaction.atomic():
+        StoredFile.objects.bulk_create(
+            stored, update_conflicts=True, unique_fields=["name"], update_fields=["ref_count", "size"]
+        )
+        StoredFile.objects.exclude(name__in=[file.name for file in stored]).update(ref_count=0)
+    return len(stored)
@@ -0,0 +1,105 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from posts.cards import invalidate_cards
+from posts.entitlements import invalidate_entitlement, subscription_expired
+from posts.images import is_image, schedule_derivatives
+from posts.metadata import extract_metadata
+from posts.models import Post, Subscription
+from posts.page_cache import invalidate_pages
+from posts.search import invalidate_search_results, update_search_terms
+from posts.services import release_file, retain_file
+
+SEARCHABLE_FIELDS = {"title", "description"}
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_save, sender="users.Payment")
+@receiver(post_delete, sender="users.Payment")
+def reset_entitlement(sender, instance, **kwargs):
+    """Сбрасываем закешированные права пользователя при изменении подписки или платежа"""
+    invalidate_entitlement(instance.user_id)
+
+
+@receiver(subscription_expired)
+def reset_expired_entitlements(sender, subscriptions, **kwargs):
+    """UPDATE в expire_subscriptions не вызывает post_save, поэтому права сбрасываются здесь"""
+    for _, user_id in subscriptions:
+        invalidate_entitlement(user_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Запоминаем прежние заголовок и файл одним запросом: заголовок нужен словарю поисковых подсказок,
+    а новый файл требует новых уменьшенных копий и сведений о нём (вид, размеры, длительность)
+    """
+    instance._previous_title = instance.title
+    instance._previous_file = ""
+    instance._file_changed = False
+    if raw or (update_fields is not None and not {"title", "file"} & set(update_fields)):
+        return
+    previous = ("", "")
+    if instance.pk is not None:
+        previous = Post.objects.filter(pk=instance.pk).values_list("title", "file").first() or previous
+    previous_title, previous_file = previous
+    if update_fields is None or "title" in update_fields:
+        instance._previous_title = previous_title or ""
+    if update_fields is None or "file" in update_fields:
+        instance._previous_file = previous_file or ""
+        instance._file_changed = instance._previous_file != (instance.file.name or "")
+        if instance._file_changed:
+            instance.has_derivatives = False
+            for field, value in extract_metadata(instance.file).items():
+                setattr(instance, field, value)
+
+
+@receiver(post_save, sender=Post)
+def update_title_terms(sender, instance, update_fields=None, **kwargs):
+    previous_title = getattr(instance, "_previous_title", instance.title)
+    if previous_title != instance.title:
+        update_search_terms(previous_title, instance.title)
+    if update_fields is None or SEARCHABLE_FIELDS & set(update_fields):
+        invalidate_search_results()
+
+
+@receiver(post_delete, sender=Post)
+def remove_title_terms(sender, instance, **kwargs):
+    update_search_terms(instance.title, "")
+    invalidate_search_results()
+
+
+@receiver(post_delete, sender=Post)
+def remove_cards(sender, instance, **kwargs):
+    invalidate_cards(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def reset_pages(sender, instance, **kwargs):
+    """Лента и страница поста закешированы целиком — сбрасываем обе"""
+    invalidate_pages("feed", f"post:{instance.pk}")
+
+
+@receiver(post_save, sender=Post)
+def count_file_references(sender, instance, raw=False, **kwargs):
+    """Ссылки постов на файлы хранилища: одинаковые загрузки делят один файл (см. posts.storage)"""
+    if raw or not getattr(instance, "_file_changed", False):
+        return
+    if instance.file.name:
+        retain_file(instance.file.name)
+    if instance._previous_file:
+        release_file(instance._previous_file)
+
+
+@receiver(post_delete, sender=Post)
+def release_post_file(sender, instance, **kwargs):
+    if instance.file.name:
+        release_file(instance.file.name)
+
+
+@receiver(post_save, sender=Post)
+def build_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw and getattr(instance, "_file_changed", False) and is_image(instance.file.name):
+        schedule_derivatives(instance)
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CONTENT_DIR = "uploads"
+PARTIAL_DIR = f"{CONTENT_DIR}/partial"  # Недописанные файлы: на той же файловой системе, чтобы переносить их rename
+SHARD_LEVELS = 2  # uploads/ab/cd/abcd…: в каталоге не больше 256 подкаталогов, файлы расходятся равномерно
+CONTENT_NAME_RE = re.compile(rf"^{CONTENT_DIR}/(?:[0-9a-f]{{2}}/){{{SHARD_LEVELS}}}[0-9a-f]{{64}}(\.\w+)?$")
+
+
+def content_name(digest, extension=""):
+    """Имя файла по SHA-256 содержимого: uploads/ab/cd/abcd….mp4"""
+    shards = re.findall("..", digest)[:SHARD_LEVELS]
+    return "/".join([CONTENT_DIR, *shards, f"{digest}.{extension}" if extension else digest])
+
+
+def is_content_name(name):
+    return bool(CONTENT_NAME_RE.match(name or ""))
+
+
+def name_extension(name):
+    base = os.path.basename(name)
+    return base.rsplit(".", 1)[-1].lower() if "." in base else ""
+
+
+@deconstructible(path="posts.storage.ContentAddressedStorage")
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище файлов постов по содержимому. Имя файла — его SHA-256, поэтому одинаковые загрузки
+    хранятся один раз; сколько постов ссылается на файл, считает StoredFile (см. posts.services).
+    Исходное имя загрузки сохраняется только в расширении.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        os.makedirs(self.path(PARTIAL_DIR), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.path(PARTIAL_DIR))
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as target:
+            for chunk in content.chunks():
+                digest.update(chunk)
+                target.write(chunk)
+        return self.adopt(temp_path, digest.hexdigest(), name_extension(name))
+
+    def adopt(self, path, digest, extension):
+        """
+        Переносит готовый файл с диска (из PARTIAL_DIR) на место по его хешу. Перенос — атомарный rename:
+        читатели не видят недописанных файлов, а одновременная загрузка того же содержимого просто совпадёт.
+        """
+        name = content_name(digest, extension)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.remove(path)
+            return name
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        os.chmod(path, self.file_permissions_mode or 0o644)
+        os.replace(path, full_path)
+        return name
+
+
+content_storage = ContentAddressedStorage()
@@ -1,7 +1,20 @@
 from django import template
+from django.template.backends.utils import csrf_input
+from django.utils.html import format_html
+
+from posts.counters import get_view_counter
+from posts.images import DERIVATIVE_WIDTHS, derivative_name
+from posts.media import media_url as signed_media_url
+from posts.page_cache import page_hole
 
 register = template.Library()
 
+# Ширина картинки на странице для атрибута sizes: браузер сам выберет подходящую копию из srcset
+PICTURE_SIZES = {
+    "card": "(max-width: 576px) 100vw, 320px",
+    "detail": "(max-width: 768px) 100vw, 640px",
+}
+
 
 @register.filter()
 def media_filter(path):
@@ -9,3 +22,91 @@ def media_filter(path):
         return f"/media/{path}"
     else:
         return "#"
+
+
+@register.filter()
+def locked(post, entitlement):
+    """Закрыт ли платный пост для текущего посетителя (см. posts.entitlements)"""
+    if not post:
+        return False
+    if entitlement is None:
+        return post.premium
+    return entitlement.is_locked(post)
+
+
+@register.simple_tag(takes_context=True)
+def user_email(context):
+    """Email пользователя в меню; в кешируемой странице — метка, которую заполняет кеш страниц"""
+    return page_hole(
+        context.get("request"), "user_email", "", lambda: getattr(context.get("user"), "email", None) or ""
+    )
+
+
+@register.simple_tag(takes_context=True)
+def view_count(context, post):
+    """Просмотры поста: счётчик из БД плюс ещё не сброшенные просмотры (см. posts.counters)"""
+    return page_hole(context.get("request"), "view_count", post.pk, lambda: get_view_counter().count(post.pk))
+
+
+@register.simple_tag(takes_context=True)
+def like_count(context, post):
+    """Лайки поста; в кешируемой странице — метка, чтобы лайк не сбрасывал ленту целиком (см. posts.services)"""
+    return page_hole(context.get("request"), "like_count", post.pk, lambda: post.like_count)
+
+
+@register.simple_tag(takes_context=True)
+def liked(context, post):
+    """CSS-класс кнопки лайка; liked_post_ids — лайки текущего пользователя на странице (см. posts.services)"""
+    liked_ids = context.get("liked_post_ids", ())
+    return page_hole(context.get("request"), "liked", post.pk, lambda: "active" if post.pk in liked_ids else "")
+
+
+@register.simple_tag(takes_context=True)
+def csrf_hole(context):
+    """Аналог {% csrf_token %} для страниц из кеша страниц: токен подставляется при каждой отдаче"""
+    request = context.get("request")
+    return page_hole(request, "csrf_input", "", lambda: csrf_input(request))
+
+
+@register.simple_tag
+def picture(post, size, css_class="", style=""):
+    """
+    Изображение поста через <picture>: WebP и JPEG копии разной ширины, пока копий нет — оригинал.
+    Размеры из сведений о файле резервируют место под картинку до её загрузки.
+    """
+    dimensions = format_html(' width="{}" height="{}"', post.width, post.height) if post.width and post.height else ""
+    if not post.has_derivatives:
+        return format_html(
+            '<img src="{}"{} class="{}" style="{}" alt="{}" loading="lazy">',
+            signed_media_url(post.file.name, post.premium),
+            dimensions,
+            css_class,
+            style,
+            post.title,
+        )
+
+    def srcset(fmt):
+        return ", ".join(
+            f"{signed_media_url(derivative_name(post.file.name, width, fmt), post.premium)} {width}w"
+            for width in DERIVATIVE_WIDTHS
+        )
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{} class="{}" style="{}" alt="{}" loading="lazy"></picture>',
+        srcset("webp"),
+        PICTURE_SIZES[size],
+        signed_media_url(derivative_name(post.file.name, DERIVATIVE_WIDTHS[1], "jpeg"), post.premium),
+        srcset("jpeg"),
+        PICTURE_SIZES[size],
+        dimensions,
+        css_class,
+        style,
+        post.title,
+    )
+
+
+@register.simple_tag
+def media_url(post):
+    """Подписанная ссылка на файл поста (см. posts.media)"""
+    return signed_media_url(post.file.name, post.premium)
@@ -1,8 +1,49 @@
-from django.test import Client, TestCase
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.timezone import now
+from PIL import Image
 
-from posts.models import Post
-from users.models import User
+from posts.counters import RedisViewCounter, flush_view_counts, get_view_counter
+from posts.entitlements import get_entitlement, subscription_expired
+from posts.forms import PostForm
+from posts.images import DERIVATIVE_WIDTHS, _on_done, derivative_name
+from posts.media import PREMIUM_URL_MAX_AGE, PREVIEW_MAX_BYTES, media_url
+from posts.models import (Comment, Like, MediaType, Post, SearchTerm, StoredFile, Subscription, TrendingScore,
+                          UploadSession)
+from posts.moderation import forbidden_words
+from posts.paginations import estimated_count
+from posts.services import comment_threads, create_comment, delete_comment, like_post, unlike_post
+from posts.storage import content_name
+from posts.trending import TRENDING_WINDOW, refresh_trending, stale_posts
+from users.models import Payment, User
 
 
 class PostTestCase(TestCase):
@@ -104,6 +145,28 @@ class SearchResultsViewTest(TestCase):
         self.assertEqual(len(response.context["results"]), 1)
         self.assertEqual(response.context["query"], search_term)
 
+    def test_title_match_ranked_above_description_match(self):
+        """Совпадение в заголовке весит больше, чем в описании."""
+        in_description = Post.objects.create(title="Заметка", description="Про Django и шаблоны", author=self.user)
+        in_title = Post.objects.create(title="Django для начинающих", description="Введение", author=self.user)
+
+        response = self.client.get(reverse("posts:search_results"), {"q": "django"})
+
+        self.assertEqual([post.pk for post in response.context["results"]], [in_title.pk, in_description.pk])
+
+    def test_index_follows_post_updates(self):
+        self.post1.title = "Переименованный пост"
+        self.post1.save()
+
+        response = self.client.get(reverse("posts:search_results"), {"q": "переименованный"})
+        self.assertEqual([post.pk for post in response.context["results"]], [self.post1.pk])
+
+    def test_search_syntax_is_ignored(self):
+        """Кавычки и операторы поискового синтаксиса в запросе не ломают поиск."""
+        response = self.client.get(reverse("posts:search_results"), {"q": '"Первый* -(пост:'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post.pk for post in response.context["results"]], [self.post1.pk])
+
     def test_no_results_found(self):
         """Проверка поиска без результатов."""
         url = reverse("posts:search_results")
@@ -113,3 +176,1347 @@ class SearchResultsViewTest(TestCase):
         self.assertTemplateUsed(response, "posts/search_results.html")
         self.assertFalse(response.context["results"])  # Никаких результатов найдено
         self.assertEqual(response.context["query"], search_term)
+
+
+class PostListPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79111111111", email="test@test.ru")
+        cls.posts = [
+            Post.objects.create(title=f"Пост {i}", description="Описание", author=cls.user) for i in range(12)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_follow_recency_without_gaps(self):
+        """Переход по курсорам next обходит все посты от новых к старым без повторов."""
+        url = reverse("posts:home")
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(url, {"cursor": cursor} if cursor else {})
+            self.assertEqual(response.status_code, 200)
+            page = response.context["page_obj"]
+            seen.extend(post.pk for post in page.object_list)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+        self.assertEqual(page.number, 3)
+        self.assertEqual(page.paginator.num_pages, 3)
+
+    def test_previous_cursor_returns_previous_page(self):
+        url = reverse("posts:home")
+        first = self.client.get(url).context["page_obj"]
+        second = self.client.get(url, {"cursor": first.next_cursor}).context["page_obj"]
+        back = self.client.get(url, {"cursor": second.previous_cursor}).context["page_obj"]
+
+        self.assertEqual([p.pk for p in back.object_list], [p.pk for p in first.object_list])
+        self.assertEqual(back.number, 1)
+        self.assertFalse(back.has_previous())
+
+    def test_last_page(self):
+        page = self.client.get(reverse("posts:home"), {"cursor": "last"}).context["page_obj"]
+        self.assertEqual([p.pk for p in page.object_list], [p.pk for p in self.posts[1::-1]])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_no_last_page_for_estimated_count(self):
+        """По оценке количества последняя страница не совпала бы со страницами next: ссылки на неё нет."""
+        with patch("posts.paginations.count_estimate", return_value=(12, False)):
+            response = self.client.get(reverse("posts:home"))
+            self.assertTrue(response.context["page_obj"].has_next())
+            self.assertNotContains(response, "cursor=last")
+            self.assertEqual(self.client.get(reverse("posts:home"), {"cursor": "last"}).status_code, 404)
+        cache.clear()
+        self.assertContains(self.client.get(reverse("posts:home")), "cursor=last")
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("posts:home"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_cursor_values(self):
+        """Курсор с чужими типами значений — 404, а не ошибка сервера."""
+        for values in ([{"dt": "x"}, 1], [{"dt": 5}, 1], [{"dt": "2026-01-01T00:00:00+00:00"}, "abc"], [[1], 1], 7):
+            cursor = base64.urlsafe_b64encode(json.dumps({"d": "next", "v": values, "n": 2}).encode()).decode()
+            for url in (reverse("posts:home"), reverse("posts:trending")):
+                with self.subTest(values=values, url=url):
+                    self.assertEqual(self.client.get(url, {"cursor": cursor}).status_code, 404)
+
+
+class EntitlementTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(phone_number="+79000000001")
+        self.reader = User.objects.create_user(phone_number="+79000000002")
+        self.post = Post.objects.create(title="Платный пост", author=self.author, premium=True)
+
+    def subscribe(self, user, days=30):
+        subscription = Subscription.objects.create(user=user, active=True)
+        subscription.ends_at = now() + timedelta(days=days)
+        subscription.save()
+        return subscription
+
+    def test_premium_post_locked_without_subscription(self):
+        entitlement = get_entitlement(self.reader)
+        self.assertFalse(entitlement.is_subscriber)
+        self.assertTrue(entitlement.is_locked(self.post))
+        self.assertFalse(get_entitlement(self.author).is_locked(self.post))
+
+    def test_expired_subscription_does_not_unlock(self):
+        self.subscribe(self.reader, days=-1)
+        self.assertTrue(get_entitlement(self.reader).is_locked(self.post))
+
+    def test_subscription_change_invalidates_cache(self):
+        self.assertTrue(get_entitlement(self.reader).is_locked(self.post))
+        self.subscribe(self.reader)
+        self.assertFalse(get_entitlement(self.reader).is_locked(self.post))
+
+    def test_resolved_once_and_cached_across_requests(self):
+        """Подписка запрашивается один раз на запрос, а следующий запрос берёт права из кеша."""
+        self.subscribe(self.reader)
+        for i in range(5):
+            Post.objects.create(title=f"Пост {i}", author=self.author, premium=True)
+        self.client.force_login(self.reader)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("posts:home"))
+        subscription_queries = [q for q in queries if "posts_subscription" in q["sql"]]
+        self.assertEqual(len(subscription_queries), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("posts:home"))
+        self.assertFalse([q for q in queries if "posts_subscription" in q["sql"]])
+        self.assertNotContains(response, "Данный контент доступен только подписчикам.")
+
+    def test_expire_subscriptions(self):
+        expired = self.subscribe(self.reader, days=-1)
+        current = self.subscribe(self.author)
+        events = []
+
+        def record(sender, subscriptions, **kwargs):
+            events.extend(subscriptions)
+
+        subscription_expired.connect(record)
+        self.addCleanup(subscription_expired.disconnect, record)
+
+        call_command("expire_subscriptions", batch_size=1, stdout=io.StringIO())
+
+        expired.refresh_from_db()
+        current.refresh_from_db()
+        self.assertFalse(expired.active)
+        self.assertTrue(current.active)
+        self.assertEqual(events, [(expired.pk, self.reader.pk)])
+
+    def test_inactive_subscription_does_not_unlock(self):
+        subscription = self.subscribe(self.reader)
+        subscription.active = False
+        subscription.save()
+        self.assertTrue(get_entitlement(self.reader).is_locked(self.post))
+
+
+class QueryBudgetMixin:
+    """
+    Бюджет SQL-запросов для страниц: тест падает, если страница выполняет больше запросов,
+    чем заявлено, — так возвращение N+1 (запрос на каждую карточку) сразу заметно.
+    """
+
+    def assertQueryBudget(self, budget, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"{url}: {len(queries)} запросов при бюджете {budget}:\n" + "\n".join(query["sql"] for query in queries),
+        )
+        return response
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    # Для авторизованных сюда входят чтение сессии и пользователя, права подписки
+    # и сохранение сессии (SESSION_SAVE_EVERY_REQUEST) вместе с точками сохранения транзакции,
+    # а на странице поста — ещё и проверка прав на удаление
+    QUERY_BUDGETS = {
+        # У авторизованных +1 запрос: какие посты страницы пользователь уже лайкнул;
+        # у страниц с ETag при промахе кеша +1 на время изменения для Last-Modified
+        # и у страниц с кнопкой лайка +1 на счётчики лайков из БД, пока их нет в кеше
+        "posts:home": {"anonymous": 4, "authenticated": 11},
+        "posts:search_results": {"anonymous": 2, "authenticated": 8},
+        # +1 на счётчик просмотров из БД, пока его нет в кеше
+        "posts:post_detail": {"anonymous": 4, "authenticated": 12},
+        "posts:post_delete": {"authenticated": 6},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number="+79000000001")
+        cls.reader = User.objects.create_user(phone_number="+79000000002")
+        cls.posts = [
+            Post.objects.create(
+                title=f"Пост {i}",
+                description="Длинное описание поста. " * 50,
+                author=cls.author,
+                premium=i % 2 == 0,
+                file=f"uploads/test/post_{i}.{'mp4' if i % 3 == 0 else 'jpg'}",
+            )
+            for i in range(10)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def urls(self):
+        yield "posts:home", reverse("posts:home"), None
+        yield "posts:search_results", reverse("posts:search_results"), {"q": "Пост"}
+        yield "posts:post_detail", reverse("posts:post_detail", args=(self.posts[0].pk,)), None
+
+    def test_anonymous_budget(self):
+        for name, url, data in self.urls():
+            with self.subTest(name):
+                self.assertQueryBudget(self.QUERY_BUDGETS[name]["anonymous"], url, data)
+
+    def test_authenticated_budget(self):
+        self.client.force_login(self.reader)
+        for name, url, data in self.urls():
+            with self.subTest(name):
+                self.assertQueryBudget(self.QUERY_BUDGETS[name]["authenticated"], url, data)
+
+    def test_delete_confirmation_loads_post_once(self):
+        self.client.force_login(self.author)
+        url = reverse("posts:post_delete", args=(self.posts[0].pk,))
+        self.assertQueryBudget(self.QUERY_BUDGETS["posts:post_delete"]["authenticated"], url)
+
+    def test_cards_skip_full_description(self):
+        response = self.client.get(reverse("posts:home"))
+        post = response.context["object_list"][0]
+        self.assertIn("description", post.get_deferred_fields())
+        self.assertLessEqual(len(post.excerpt), 101)
+
+
+class SearchSuggestTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79111111111")
+        Post.objects.create(title="Программирование на Python", author=cls.user)
+        Post.objects.create(title="Программа тренировок", author=cls.user)
+        Post.objects.create(title="Программирование игр", author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def suggest(self, query):
+        response = self.client.get(reverse("posts:search_suggest"), {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["suggestions"]
+
+    def test_completes_last_word_by_frequency(self):
+        self.assertEqual(self.suggest("прог"), ["программирование", "программа"])
+        self.assertEqual(self.suggest("игры pyt"), ["игры python"])
+
+    def test_short_prefix_returns_nothing(self):
+        self.assertEqual(self.suggest("п"), [])
+
+    def test_dictionary_follows_title_changes(self):
+        post = Post.objects.get(title="Программа тренировок")
+        post.title = "Тренировки"
+        post.save()
+        self.assertEqual(self.suggest("программа"), [])
+        self.assertFalse(SearchTerm.objects.filter(term="тренировок").exists())
+
+        post.delete()
+        self.assertFalse(SearchTerm.objects.filter(term="тренировки").exists())
+        self.assertEqual(SearchTerm.objects.get(term="программирование").frequency, 2)
+
+    def test_did_you_mean_on_empty_results(self):
+        response = self.client.get(reverse("posts:search_results"), {"q": "програмирование"})
+        self.assertFalse(response.context["results"])
+        self.assertEqual(response.context["suggestion"], "программирование")
+        self.assertContains(response, "Возможно, вы имели в виду")
+
+
+class SearchPaginationCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79111111111")
+        cls.posts = [Post.objects.create(title=f"Заметка {i}", author=cls.user) for i in range(12)]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, cursor=None):
+        data = {"q": query, "cursor": cursor} if cursor else {"q": query}
+        return self.client.get(reverse("posts:search_results"), data)
+
+    def test_results_are_paginated(self):
+        seen = []
+        cursor = None
+        while True:
+            page = self.search("заметка", cursor).context["page_obj"]
+            self.assertLessEqual(len(page.object_list), 5)
+            seen.extend(post.pk for post in page.object_list)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(sorted(seen), sorted(post.pk for post in self.posts))
+        self.assertEqual(page.number, page.paginator.num_pages)
+
+    def test_malformed_cursor_values(self):
+        for values in (["a"], [True], [-5], [1.5]):
+            cursor = base64.urlsafe_b64encode(json.dumps({"d": "next", "v": values, "n": 2}).encode()).decode()
+            with self.subTest(values=values):
+                self.assertEqual(self.search("заметка", cursor).status_code, 404)
+
+    def test_repeated_query_skips_search(self):
+        """Повторный (и по-другому записанный) запрос берёт id выдачи из кеша."""
+        self.search("Заметка")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search("  заметка!")
+        self.assertEqual(len(queries), 1)  # Только карточки текущей страницы
+        self.assertEqual(len(response.context["results"]), 5)
+
+    def test_post_changes_invalidate_cached_results(self):
+        self.assertEqual(self.search("новая").context["page_obj"].paginator.count, 0)
+        Post.objects.create(title="Новая заметка", author=self.user)
+        self.assertEqual(self.search("новая").context["page_obj"].paginator.count, 1)
+
+        self.posts[0].delete()
+        self.assertEqual(self.search("заметка").context["page_obj"].paginator.count, 12)
+
+
+class PostCardCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number="+79000000001")
+        cls.reader = User.objects.create_user(phone_number="+79000000002")
+        cls.premium = Post.objects.create(
+            title="Платный пост", author=cls.author, premium=True, file="uploads/test/premium.jpg"
+        )
+        cls.free = Post.objects.create(title="Бесплатный пост", author=cls.author, file="uploads/test/free.jpg")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_rendered_once(self):
+        with patch("posts.cards.render_to_string", wraps=render_to_string) as render:
+            self.client.get(reverse("posts:home"))
+            self.assertEqual(render.call_count, 2)
+            self.client.get(reverse("posts:home"))
+            self.assertEqual(render.call_count, 2)
+
+    def test_saving_post_refreshes_card(self):
+        self.client.get(reverse("posts:home"))
+        self.free.title = "Новый заголовок"
+        self.free.save()
+        self.assertContains(self.client.get(reverse("posts:home")), "Новый заголовок")
+
+    def test_variants_per_viewer_class(self):
+        overlay = "Данный контент доступен только подписчикам."
+        self.assertContains(self.client.get(reverse("posts:home")), overlay, count=1)
+
+        self.client.force_login(self.author)
+        self.assertNotContains(self.client.get(reverse("posts:home")), overlay)
+
+        subscription = Subscription.objects.create(user=self.reader, active=True)
+        subscription.set_end_date()
+        self.client.force_login(self.reader)
+        self.assertNotContains(self.client.get(reverse("posts:home")), overlay)
+
+
+class PageCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number="+79000000001", email="author@example.com")
+        cls.reader = User.objects.create_user(phone_number="+79000000002", email="reader@example.com")
+        cls.other = User.objects.create_user(phone_number="+79000000003", email="other@example.com")
+        cls.premium = Post.objects.create(
+            title="Платный пост", author=cls.author, premium=True, file="uploads/test/premium.jpg"
+        )
+        cls.free = Post.objects.create(title="Бесплатный пост", author=cls.author, file="uploads/test/free.jpg")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_feed_served_from_cache(self):
+        self.assertEqual(self.client.get(reverse("posts:home"))["X-Page-Cache"], "miss")
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("posts:home"))
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertContains(response, "Бесплатный пост")
+
+    def test_moderator_page_not_shared(self):
+        moderator = User.objects.create_user(phone_number="+79000000004")
+        # Право выдаётся вручную в админке, в моделях его нет
+        permission = Permission.objects.create(
+            codename="can_delete_any_post",
+            name="Удаление любых постов",
+            content_type=ContentType.objects.get_for_model(Post),
+        )
+        moderator.user_permissions.add(permission)
+        detail = reverse("posts:post_detail", kwargs={"pk": self.free.pk})
+        delete = reverse("posts:post_delete", kwargs={"pk": self.free.pk})
+        self.client.force_login(moderator)
+        self.assertContains(self.client.get(detail), delete)
+        self.client.force_login(self.reader)
+        self.assertNotContains(self.client.get(detail), delete)
+
+    def test_saving_post_invalidates_feed_and_detail(self):
+        detail = reverse("posts:post_detail", kwargs={"pk": self.free.pk})
+        self.client.get(reverse("posts:home"))
+        self.client.get(detail)
+        self.free.title = "Новый заголовок"
+        self.free.save()
+        self.assertContains(self.client.get(reverse("posts:home")), "Новый заголовок")
+        self.assertContains(self.client.get(detail), "Новый заголовок")
+
+    def test_variants_per_audience(self):
+        overlay = "Данный контент доступен только подписчикам."
+        self.assertContains(self.client.get(reverse("posts:home")), overlay)
+
+        subscription = Subscription.objects.create(user=self.reader, active=True)
+        subscription.set_end_date()
+        self.client.force_login(self.reader)
+        self.assertNotContains(self.client.get(reverse("posts:home")), overlay)
+
+    def test_email_filled_per_user(self):
+        self.client.force_login(self.reader)
+        self.client.get(reverse("posts:home"))
+        self.client.force_login(self.other)
+        response = self.client.get(reverse("posts:home"))
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertContains(response, "other@example.com")
+        self.assertNotContains(response, "reader@example.com")
+
+    def test_personal_pages_not_cached(self):
+        # Страница платного поста для авторизованного без подписки содержит форму с CSRF-токеном
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse("posts:post_detail", kwargs={"pk": self.premium.pk}))
+        self.assertFalse(response.has_header("X-Page-Cache"))
+
+        # Автор видит свои платные посты открытыми и кнопки редактирования
+        self.client.force_login(self.author)
+        self.assertFalse(self.client.get(reverse("posts:home")).has_header("X-Page-Cache"))
+        response = self.client.get(reverse("posts:post_detail", kwargs={"pk": self.free.pk}))
+        self.assertFalse(response.has_header("X-Page-Cache"))
+        self.assertContains(response, "Редактировать")
+        self.assertContains(response, "author@example.com")
+
+
+class ViewCounterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79000000001")
+        cls.post = Post.objects.create(title="Пост", author=cls.user, view_count=10)
+        cls.other = Post.objects.create(title="Другой пост", author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_buffered_until_flush(self):
+        url = reverse("posts:post_detail", kwargs={"pk": self.post.pk})
+        self.client.get(url)
+        self.assertContains(self.client.get(url), "Просмотров: 11")  # Из кеша страниц, но счётчик свежий
+        self.assertContains(self.client.get(url), "Просмотров: 12")
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 10)
+        self.assertEqual(get_view_counter().count(self.post.pk), 13)
+
+    def test_flush_applies_deltas_in_one_update(self):
+        counter = get_view_counter()
+        for _ in range(3):
+            counter.increment(self.post.pk)
+        self.other.increment_view_count()
+
+        # UPDATE с CASE и чтение новых значений; в тесте транзакция пачки — точка сохранения (ещё 2 запроса)
+        with self.assertNumQueries(4):
+            self.assertEqual(flush_view_counts(), 4)
+
+        self.post.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.post.view_count, self.other.view_count), (13, 1))
+        self.assertEqual(counter.count(self.post.pk), 13)
+        self.assertEqual(flush_view_counts(), 0)
+
+
+class FakeRedis:
+    """Хеши Redis в памяти — команды, которыми пользуется RedisViewCounter; значения, как в Redis, — байты"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.queued = []
+
+    def hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        fields[str(field).encode()] = str(int(fields.get(str(field).encode(), 0)) + amount).encode()
+
+    def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(str(field).encode()) for field in fields]
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(str(field).encode(), None)
+
+    def exists(self, key):
+        return int(bool(self.hashes.get(key)))
+
+    def renamenx(self, key, new_key):
+        if self.hashes.get(new_key):
+            return False
+        self.hashes[new_key] = self.hashes.pop(key)
+        return True
+
+    def pipeline(self):
+        client = self
+
+        class Pipeline:
+            def hmget(self, key, fields):
+                client.queued.append(client.hmget(key, fields))
+
+            def execute(self):
+                results, client.queued = client.queued, []
+                return results
+
+        return Pipeline()
+
+
+class RedisViewCounterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79000000001")
+        cls.posts = [Post.objects.create(title=f"Пост {i}", author=cls.user) for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.counter = RedisViewCounter(FakeRedis(), "views", "views:flushing")
+        patcher = patch("posts.counters.get_view_counter", return_value=self.counter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pending_views_survive_rename(self):
+        self.counter.increment(self.posts[0].pk, 2)
+        self.assertEqual(self.counter.take(), {self.posts[0].pk: 2})
+        self.counter.increment(self.posts[0].pk)
+        self.assertEqual(self.counter.pending([self.posts[0].pk]), {self.posts[0].pk: 3})
+
+    def test_interrupted_flush_not_applied_twice(self):
+        for post in self.posts:
+            self.counter.increment(post.pk, 5)
+
+        # Вторая пачка не снимается с буфера: её UPDATE откатывается, первая уже снята
+        done, batches = self.counter.done, []
+
+        def fail_second(pks):
+            batches.append(pks)
+            if len(batches) == 2:
+                raise RuntimeError
+            done(pks)
+
+        with patch.object(self.counter, "done", side_effect=fail_second):
+            with self.assertRaises(RuntimeError):
+                flush_view_counts(batch_size=1)
+        self.assertEqual(flush_view_counts(batch_size=1), 10)
+
+        self.assertEqual([Post.objects.get(pk=post.pk).view_count for post in self.posts], [5, 5, 5])
+        self.assertEqual(self.counter.take(), {})
+
+    def test_flush_never_shows_views_twice(self):
+        pk = self.posts[0].pk
+        self.counter.increment(pk, 5)
+        self.assertEqual(self.counter.count(pk), 5)
+        seen = []
+        done, set_base = self.counter.done, self.counter.set_base
+
+        def record(method):
+            def wrapper(*args):
+                seen.append(self.counter.count(pk))
+                method(*args)
+                seen.append(self.counter.count(pk))
+
+            return wrapper
+
+        with patch.object(self.counter, "done", record(done)):
+            with patch.object(self.counter, "set_base", record(set_base)):
+                flush_view_counts()
+        self.assertLessEqual(max(seen), 5)
+        self.assertEqual(self.counter.count(pk), 5)
+
+
+class LikeTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79000000001", email="user@example.com")
+        cls.other = User.objects.create_user(phone_number="+79000000002", email="other@example.com")
+        cls.posts = [Post.objects.create(title=f"Пост {i}", author=cls.other) for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def like(self, post):
+        return self.client.post(reverse("posts:post_like", kwargs={"pk": post.pk})).json()
+
+    def test_toggle_maintains_counter(self):
+        self.assertEqual(self.like(self.posts[0]), {"liked": True, "like_count": 1})
+        self.client.force_login(self.other)
+        self.assertEqual(self.like(self.posts[0]), {"liked": True, "like_count": 2})
+        self.assertEqual(self.like(self.posts[0]), {"liked": False, "like_count": 1})
+
+    def test_repeated_like_is_ignored(self):
+        self.assertTrue(like_post(self.user, self.posts[0].pk))
+        self.assertFalse(like_post(self.user, self.posts[0].pk))
+        self.assertFalse(unlike_post(self.other, self.posts[0].pk))
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].like_count, 1)
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_like_requires_login_and_post(self):
+        self.client.logout()
+        response = self.client.post(reverse("posts:post_like", kwargs={"pk": self.posts[0].pk}))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("posts:post_like", kwargs={"pk": self.posts[0].pk})).status_code, 405)
+        self.assertEqual(self.client.post(reverse("posts:post_like", kwargs={"pk": 999})).status_code, 404)
+
+    def test_feed_marks_liked_posts_per_user(self):
+        like_post(self.user, self.posts[1].pk)
+        self.client.get(reverse("posts:home"))  # Страница уходит в кеш
+
+        response = self.client.get(reverse("posts:home"))
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertContains(response, "like-button active", count=1)
+
+        self.client.force_login(self.other)
+        self.assertNotContains(self.client.get(reverse("posts:home")), "like-button active")
+
+    def test_like_refreshes_cached_counts(self):
+        for url in (reverse("posts:home"), reverse("posts:trending")):
+            with self.subTest(url=url):
+                cache.clear()
+                refresh_trending(full=True)
+                self.client.get(url)  # Страница уходит в кеш
+                like_post(self.other, self.posts[0].pk)
+                response = self.client.get(url)
+                self.assertEqual(response["X-Page-Cache"], "hit")  # Счётчик — «дырка», лайк не сбрасывает ленту
+                self.assertContains(response, '<span class="like-count">1</span>')
+                unlike_post(self.other, self.posts[0].pk)
+                self.assertContains(self.client.get(url), '<span class="like-count">1</span>', count=0)
+
+
+class CommentThreadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79000000001", first_name="Анна")
+        cls.author = User.objects.create_user(phone_number="+79000000002")
+        cls.post = Post.objects.create(title="Пост", author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_threads_in_tree_order_with_two_queries(self):
+        first = create_comment(self.user, self.post.pk, "Первый")
+        second = create_comment(self.user, self.post.pk, "Второй")
+        reply = create_comment(self.user, self.post.pk, "Ответ", parent=first)
+        create_comment(self.user, self.post.pk, "Ответ на ответ", parent=reply)
+        create_comment(self.user, self.post.pk, "Ответ второму", parent=second)
+
+        with self.assertNumQueries(2):  # Корни страницы и все их ответы
+            page = comment_threads(self.post)
+        self.assertEqual(
+            [(c.text, c.depth) for c in page],
+            [("Первый", 0), ("Ответ", 1), ("Ответ на ответ", 2), ("Второй", 0), ("Ответ второму", 1)],
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 5)
+
+        self.assertEqual(delete_comment(first), 3)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+    def test_top_level_threads_paginated_by_cursor(self):
+        for i in range(5):
+            create_comment(self.user, self.post.pk, f"Комментарий {i}")
+        page = comment_threads(self.post, per_page=3)
+        self.assertEqual([c.text for c in page], ["Комментарий 0", "Комментарий 1", "Комментарий 2"])
+        page = comment_threads(self.post, page.next_cursor, per_page=3)
+        self.assertEqual([c.text for c in page], ["Комментарий 3", "Комментарий 4"])
+        self.assertFalse(page.has_next())
+
+    def test_comment_endpoint_and_cached_detail(self):
+        url = reverse("posts:post_detail", kwargs={"pk": self.post.pk})
+        self.client.force_login(self.user)
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+        response = self.client.post(reverse("posts:post_comment", kwargs={"pk": self.post.pk}), {"text": "Привет"})
+        comment = Comment.objects.get()
+        self.assertRedirects(response, f"{url}#comment-{comment.pk}", fetch_redirect_response=False)
+        self.client.post(
+            reverse("posts:post_comment", kwargs={"pk": self.post.pk}), {"text": "Ответ", "parent": comment.pk}
+        )
+        response = self.client.get(url)
+        self.assertContains(response, "Комментарии (2)")
+        self.assertContains(response, "Ответ")
+
+    def test_reply_to_invalid_parent(self):
+        self.client.force_login(self.user)
+        url = reverse("posts:post_comment", kwargs={"pk": self.post.pk})
+        self.assertEqual(self.client.post(url, {"text": "Ответ", "parent": "abc"}).status_code, 400)
+        self.assertEqual(self.client.post(url, {"text": "Ответ", "parent": "999"}).status_code, 404)
+        self.assertFalse(Comment.objects.exists())
+
+
+class TrendingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79000000001")
+        cls.quiet = Post.objects.create(title="Тихий пост", author=cls.user)
+        cls.popular = Post.objects.create(title="Популярный пост", author=cls.user, view_count=500, like_count=20)
+        cls.fresh = Post.objects.create(title="Свежий пост", author=cls.user)
+        Post.objects.filter(pk__in=[cls.quiet.pk, cls.popular.pk]).update(created_at=now() - timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_refresh_ranks_and_recomputes_only_changed(self):
+        self.assertEqual(refresh_trending(), 3)
+        ranking = list(TrendingScore.objects.order_by("-score").values_list("post_id", flat=True))
+        self.assertEqual(ranking, [self.popular.pk, self.fresh.pk, self.quiet.pk])
+
+        self.assertEqual(refresh_trending(), 0)
+        Post.objects.filter(pk=self.quiet.pk).update(comment_count=100)
+        self.assertEqual(refresh_trending(), 1)
+        self.assertEqual(TrendingScore.objects.order_by("-score").first().post_id, self.quiet.pk)
+
+    def test_posts_leave_window(self):
+        refresh_trending()
+        Post.objects.filter(pk=self.quiet.pk).update(created_at=now() - TRENDING_WINDOW - timedelta(days=1))
+        refresh_trending()
+        self.assertFalse(TrendingScore.objects.filter(post=self.quiet).exists())
+
+    def test_trending_page_in_score_order(self):
+        refresh_trending()
+        # Страница по индексу рейтинга, количество для пагинации, Last-Modified и счётчики лайков
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("posts:trending"))
+        titles = [post.title for post in response.context["object_list"]]
+        self.assertEqual(titles, ["Популярный пост", "Свежий пост", "Тихий пост"])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageDerivativesTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone_number="+79000000001")
+
+    def upload(self, width=1600, height=900):
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+        return SimpleUploadedFile("photo.png", buffer.getvalue(), content_type="image/png")
+
+    def test_derivatives_built_after_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title="Фото", author=self.user, file=self.upload())
+        post.refresh_from_db()
+        self.assertTrue(post.has_derivatives)
+
+        for width in DERIVATIVE_WIDTHS:
+            with Image.open(
+                os.path.join(settings.MEDIA_ROOT, derivative_name(post.file.name, width, "webp"))
+            ) as image:
+                self.assertEqual(image.size, (width, width * 9 // 16))
+        response = self.client.get(reverse("posts:home"))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, "/640.jpeg?s=")
+
+    def test_small_images_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title="Фото", author=self.user, file=self.upload(200, 100))
+        with Image.open(os.path.join(settings.MEDIA_ROOT, derivative_name(post.file.name, 1280, "jpeg"))) as image:
+            self.assertEqual(image.size, (200, 100))
+
+    def test_undecodable_image_logged_inline(self):
+        with patch("posts.images.render_derivatives", side_effect=Image.DecompressionBombError("bomb")):
+            with self.assertLogs("posts.images", "ERROR"), self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(title="Фото", author=self.user, file=self.upload())
+        self.assertFalse(Post.objects.get(pk=post.pk).has_derivatives)
+
+    def test_undecodable_image_logged_in_pool(self):
+        future = Future()
+        future.set_exception(ValueError("unsupported mode"))
+        with patch("posts.images.connection"), self.assertLogs("posts.images", "ERROR"):
+            _on_done(1, "uploads/photo.png")(future)
+
+    def test_backfill_command(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            post = Post.objects.create(title="Фото", author=self.user, file=self.upload())
+        self.assertFalse(Post.objects.get(pk=post.pk).has_derivatives)
+        call_command("build_image_derivatives", workers=1, stdout=io.StringIO())
+        self.assertTrue(Post.objects.get(pk=post.pk).has_derivatives)
+
+    def test_backfill_skips_undecodable_images(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            bomb = Post.objects.create(title="Большое", author=self.user, file=self.upload())
+            post = Post.objects.create(title="Фото", author=self.user, file=self.upload(200, 100))
+        out, err = io.StringIO(), io.StringIO()
+        # Пул процессов создаётся после патча, поэтому предел действует и в воркере
+        with patch.object(Image, "MAX_IMAGE_PIXELS", 100000):
+            call_command("build_image_derivatives", workers=1, batch_size=10, stdout=out, stderr=err)
+        self.assertIn(bomb.file.name, err.getvalue())
+        self.assertIn("Готово: 1, ошибок: 1", out.getvalue())
+        self.assertFalse(Post.objects.get(pk=bomb.pk).has_derivatives)
+        self.assertTrue(Post.objects.get(pk=post.pk).has_derivatives)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProtectedMediaTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number="+79000000001")
+        cls.reader = User.objects.create_user(phone_number="+79000000002")
+        cls.free = Post.objects.create(title="Бесплатный", author=cls.author, file="uploads/test/free.mp4")
+        cls.premium = Post.objects.create(
+            title="Платный", author=cls.author, premium=True, file="uploads/test/premium.mp4"
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        for name in ("free.mp4", "premium.mp4"):
+            default_storage.save(f"uploads/test/{name}", ContentFile(b"video"))
+
+    def tearDown(self):
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, "uploads"), ignore_errors=True)
+
+    def media(self, post):
+        return reverse("posts:protected_media", kwargs={"path": post.file.name})
+
+    def test_locked_card_has_no_media_link(self):
+        response = self.client.get(reverse("posts:home"))
+        self.assertContains(response, media_url(self.free.file.name, False))
+        self.assertNotContains(response, self.media(self.premium))
+
+    def test_access_checked_without_signature(self):
+        self.assertEqual(self.client.get(self.media(self.free)).status_code, 200)
+        self.assertEqual(self.client.get(self.media(self.premium)).status_code, 403)
+        subscription = Subscription.objects.create(user=self.reader, active=True)
+        subscription.set_end_date()
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(self.media(self.premium)).status_code, 200)
+
+    def test_signed_links_expire(self):
+        url = media_url(self.premium.file.name, premium=True)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "private, max-age=3600")
+        self.assertEqual(self.client.get(url.replace("s=", "s=x")).status_code, 403)
+        with patch("django.core.signing.time.time", return_value=time.time() + PREMIUM_URL_MAX_AGE + 1):
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_free_link_revoked_when_post_becomes_premium(self):
+        url = media_url(self.free.file.name, premium=False)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "private, max-age=86400")
+        Post.objects.filter(pk=self.free.pk).update(premium=True)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    @override_settings(PROTECTED_MEDIA_X_ACCEL=True)
+    def test_transfer_handed_to_nginx(self):
+        response = self.client.get(media_url(self.free.file.name, premium=False))
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/uploads/test/free.mp4")
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self.client.get("/media-access/uploads/../config/settings.py").status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), UPLOAD_CHUNK_MAX_SIZE=1024)
+class ChunkedUploadTest(TestCase):
+    CONTENT = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number="+79000000001")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def start(self, filename="clip.mp4", content=CONTENT):
+        return self.client.post(
+            reverse("posts:upload_start"),
+            {"filename": filename, "size": len(content), "sha256": hashlib.sha256(content).hexdigest()},
+        )
+
+    def put(self, upload, offset, chunk, sha256=None):
+        return self.client.put(
+            reverse("posts:upload_chunk", args=[upload]),
+            chunk,
+            content_type="application/octet-stream",
+            headers={"Upload-Offset": str(offset), "Upload-Sha256": sha256 or hashlib.sha256(chunk).hexdigest()},
+        )
+
+    def test_upload_resumes_and_publishes_post(self):
+        upload = self.start().json()["upload"]
+        self.assertEqual(self.put(upload, 0, self.CONTENT[:1024]).json()["offset"], 1024)
+        # Повтор уже принятой части (ответ потерялся при обрыве) отклоняется, статус подсказывает позицию
+        self.assertEqual(self.put(upload, 0, self.CONTENT[:1024]).status_code, 409)
+        offset = self.client.get(reverse("posts:upload_chunk", args=[upload])).json()["offset"]
+        while offset < len(self.CONTENT):
+            offset = self.put(upload, offset, self.CONTENT[offset:][:1024]).json()["offset"]
+        self.assertTrue(self.client.post(reverse("posts:upload_finish", args=[upload])).json()["completed"])
+
+        response = self.client.post(reverse("posts:post_create"), {"title": "Видео", "upload": upload})
+        post = Post.objects.get(title="Видео")
+        self.assertRedirects(response, reverse("posts:post_detail", args=[post.pk]), fetch_redirect_response=False)
+        self.assertEqual(post.file.name, content_name(hashlib.sha256(self.CONTENT).hexdigest(), "mp4"))
+        with post.file.open("rb") as stored:
+            self.assertEqual(stored.read(), self.CONTENT)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_rejected_before_transfer(self):
+        self.assertEqual(self.start(filename="script.exe").status_code, 415)
+        with override_settings(UPLOAD_MAX_SIZE=100):
+            self.assertEqual(self.start().status_code, 413)
+        # Расширение mp4, а первые байты — PNG: загрузка отменяется на первой части
+        upload = self.start().json()["upload"]
+        self.assertEqual(self.put(upload, 0, b"\x89PNG\r\n\x1a\n" + b"\x00" * 100).status_code, 415)
+        self.assertFalse(UploadSession.objects.filter(pk=upload).exists())
+        upload = self.start().json()["upload"]
+        self.assertEqual(self.put(upload, 0, self.CONTENT[:2048]).status_code, 413)
+
+    def test_corrupted_chunk_resent(self):
+        upload = self.client.post(
+            reverse("posts:upload_start"), {"filename": "clip.mp4", "size": len(self.CONTENT)}
+        ).json()["upload"]
+        chunk = self.CONTENT[:1024]
+        self.assertEqual(self.put(upload, 0, chunk[:-1] + b"\xff", hashlib.sha256(chunk).hexdigest()).status_code, 400)
+        self.assertEqual(self.put(upload, 0, chunk, "not-a-checksum").status_code, 400)
+        self.assertEqual(self.client.get(reverse("posts:upload_chunk", args=[upload])).json()["offset"], 0)
+        offset = 0
+        while offset < len(self.CONTENT):
+            offset = self.put(upload, offset, self.CONTENT[offset:][:1024]).json()["offset"]
+        self.assertTrue(self.client.post(reverse("posts:upload_finish", args=[upload])).json()["completed"])
+        self.assertEqual(UploadSession.objects.get(pk=upload).sha256, hashlib.sha256(self.CONTENT).hexdigest())
+
+    def test_checksum_mismatch_cancels_upload(self):
+        upload = self.start(content=self.CONTENT[:1000]).json()["upload"]
+        self.put(upload, 0, self.CONTENT[:12] + b"\xff" * 988)
+        self.assertEqual(self.client.post(reverse("posts:upload_finish", args=[upload])).status_code, 400)
+        self.assertFalse(UploadSession.objects.filter(pk=upload).exists())
+        response = self.client.post(reverse("posts:post_create"), {"title": "Видео", "upload": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.filter(title="Видео").exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTest(TestCase):
+    CONTENT = b"\x00\x00\x00\x18ftypmp42" + b"video" * 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number="+79000000001")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename="clip.mp4", content=CONTENT):
+        return Post.objects.create(title="Видео", author=self.author, file=SimpleUploadedFile(filename, content))
+
+    def test_identical_uploads_stored_once(self):
+        first, second = self.create_post(), self.create_post(filename="copy.mp4")
+        name = content_name(hashlib.sha256(self.CONTENT).hexdigest(), "mp4")
+        self.assertEqual(first.file.name, name)
+        self.assertEqual(second.file.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.file = SimpleUploadedFile("other.mp4", self.CONTENT + b"!")
+            second.save()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertEqual(StoredFile.objects.get(name=second.file.name).ref_count, 1)
+
+    def test_rehash_moves_legacy_files(self):
+        for day in ("01", "02"):
+            default_storage.save(f"uploads/2025/01/{day}/clip.mp4", ContentFile(self.CONTENT))
+            Post.objects.create(title="Старое", author=self.author, file=f"uploads/2025/01/{day}/clip.mp4")
+        StoredFile.objects.all().delete()
+
+        call_command("rehash_uploads", stdout=io.StringIO())
+        name = content_name(hashlib.sha256(self.CONTENT).hexdigest(), "mp4")
+        self.assertEqual(set(Post.objects.values_list("file", flat=True)), {name})
+        self.assertEqual(StoredFile.objects.get(name=name).ref_count, 2)
+        self.assertFalse(default_storage.exists("uploads/2025/01/01/clip.mp4"))
+        with default_storage.open(name) as stored:
+            self.assertEqual(stored.read(), self.CONTENT)
+
+    def test_rehash_refreshes_cached_links(self):
+        cache.clear()
+        default_storage.save("uploads/2025/01/01/clip.mp4", ContentFile(self.CONTENT))
+        post = Post.objects.create(
+            title="Старое", author=self.author, file="uploads/2025/01/01/clip.mp4", media_type=MediaType.VIDEO
+        )
+        urls = (reverse("posts:home"), reverse("posts:post_detail", args=[post.pk]))
+        for url in urls:
+            self.assertContains(self.client.get(url), "uploads/2025/01/01/clip.mp4")
+
+        call_command("rehash_uploads", stdout=io.StringIO())
+        post.refresh_from_db()
+        for url in urls:
+            response = self.client.get(url)
+            self.assertNotContains(response, "uploads/2025/01/01/clip.mp4")
+            self.assertContains(response, media_url(post.file.name, False))
+
+
+def mp4_box(kind, payload):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def mp4_file(duration=90, timescale=1000, width=1280, height=720):
+    """Минимальный MP4: ftyp, mdat и moov в конце файла, как у роликов без faststart"""
+    mvhd = mp4_box(b"mvhd", bytes(12) + struct.pack(">II", timescale, duration * timescale) + bytes(80))
+    tkhd = mp4_box(b"tkhd", bytes(76) + struct.pack(">II", width << 16, height << 16))
+    sound = mp4_box(b"trak", mp4_box(b"tkhd", bytes(84)))
+    moov = mp4_box(b"moov", mvhd + sound + mp4_box(b"trak", tkhd))
+    return mp4_box(b"ftyp", b"mp42" + bytes(4)) + mp4_box(b"mdat", bytes(1000)) + moov
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class MediaMetadataTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number="+79000000001")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_metadata_extracted_on_save(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (300, 200)).save(buffer, "PNG")
+        image = Post.objects.create(
+            title="Фото", author=self.author, file=SimpleUploadedFile("photo.png", buffer.getvalue())
+        )
+        video = Post.objects.create(title="Видео", author=self.author, file=SimpleUploadedFile("clip.mp4", mp4_file()))
+        image.refresh_from_db()
+        video.refresh_from_db()
+
+        self.assertEqual((image.media_type, image.mime_type), (MediaType.IMAGE, "image/png"))
+        self.assertEqual((image.width, image.height, image.file_size), (300, 200, len(buffer.getvalue())))
+        self.assertEqual((video.media_type, video.mime_type), (MediaType.VIDEO, "video/mp4"))
+        self.assertEqual((video.width, video.height, video.duration), (1280, 720, 90))
+
+        video.file = None
+        video.save()
+        self.assertEqual((video.media_type, video.width, video.duration), ("", None, None))
+
+    def test_feed_filtered_by_media_type(self):
+        Post.objects.create(title="Ролик", author=self.author, file=SimpleUploadedFile("clip.mp4", mp4_file()))
+        without_file = Post.objects.create(title="Без файла", author=self.author)
+        self.assertEqual(self.client.get(reverse("posts:post_detail", args=[without_file.pk])).status_code, 200)
+
+        response = self.client.get(reverse("posts:home"), {"media": "video"})
+        self.assertEqual([post.title for post in response.context["object_list"]], ["Ролик"])
+        self.assertContains(response, 'type="video/mp4"')
+        self.assertEqual(len(self.client.get(reverse("posts:home"), {"media": "other"}).context["object_list"]), 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PostPreviewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number="+79000000001")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename, content, premium=False):
+        return Post.objects.create(
+            title="Файл", author=self.author, premium=premium, file=SimpleUploadedFile(filename, content)
+        )
+
+    def test_text_preview_is_escaped_and_capped(self):
+        post = self.create_post("notes.txt", "<script>пример</script>".encode() + "ж".encode() * PREVIEW_MAX_BYTES)
+        response = self.client.get(reverse("posts:post_preview", args=[post.pk]))
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("&lt;script&gt;пример&lt;/script&gt;", content)
+        self.assertNotIn("�", content)  # Символы на границах блоков не разрезаны
+        self.assertLess(content.count("ж"), PREVIEW_MAX_BYTES // 2)
+        self.assertIn("…", content)
+
+    def test_binary_preview_streams_file(self):
+        post = self.create_post("clip.mp4", mp4_file())
+        response = self.client.get(reverse("posts:post_preview", args=[post.pk]))
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content), mp4_file())
+
+        premium = self.create_post("notes.txt", b"secret", premium=True)
+        self.assertEqual(self.client.get(reverse("posts:post_preview", args=[premium.pk])).status_code, 403)
+
+
+class StaticBuildTest(TestCase):
+
+    def test_collectstatic_emits_hashed_and_compressed_files(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root, ignore_errors=True)
+        storages = {
+            **settings.STORAGES,
+            "staticfiles": {"BACKEND": "config.storages.CompressedManifestStaticFilesStorage"},
+        }
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            hashed = staticfiles_storage.stored_name("js/likes.js")
+
+        self.assertRegex(hashed, r"^js/likes\.[0-9a-f]{12}\.js$")
+        with open(os.path.join(static_root, hashed), "rb") as original:
+            with gzip.open(os.path.join(static_root, hashed + ".gz")) as compressed:
+                self.assertEqual(compressed.read(), original.read())
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number="+79000000001")
+        cls.reader = User.objects.create_user(phone_number="+79000000002")
+        cls.post = Post.objects.create(title="Пост", description="Текст", author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, url, response):
+        return self.client.get(url, headers={"If-None-Match": response["ETag"]})
+
+    def test_unchanged_pages_answer_304_without_queries(self):
+        for url in (reverse("posts:home"), reverse("posts:post_detail", args=[self.post.pk])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response["Cache-Control"], "private, no-cache")
+                self.assertIn("Last-Modified", response)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+    def test_changes_and_visitor_produce_new_etag(self):
+        url = reverse("posts:post_detail", args=[self.post.pk])
+        response = self.client.get(url)
+        like_post(self.reader, self.post.pk)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        response = self.client.get(url)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        response = self.client.get(url)
+        Post.objects.filter(pk=self.post.pk).update(title="Новое название")
+        self.assertEqual(self.revalidate(url, response).status_code, 304)  # Правки в обход save() не видны
+        self.post.title = "Новое название"
+        self.post.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_feed_revalidates_after_own_like(self):
+        """Чужие лайки, как и просмотры, ETag ленты не меняют; свой лайк меняет (область likes:<id>)"""
+        refresh_trending(full=True)
+        self.client.force_login(self.reader)
+        for url in (reverse("posts:home"), reverse("posts:trending")):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                like_post(self.author, self.post.pk)
+                self.assertEqual(self.revalidate(url, response).status_code, 304)
+                like_post(self.reader, self.post.pk)
+                self.assertEqual(self.revalidate(url, response).status_code, 200)
+                unlike_post(self.reader, self.post.pk)
+                unlike_post(self.author, self.post.pk)
+
+    def test_if_modified_since(self):
+        url = reverse("posts:home")
+        response = self.client.get(url)
+        modified = self.client.get(url, headers={"If-Modified-Since": response["Last-Modified"]})
+        self.assertEqual(modified.status_code, 304)
+
+    def test_revalidated_view_is_counted(self):
+        url = reverse("posts:post_detail", args=[self.post.pk])
+        response = self.client.get(url)
+        self.revalidate(url, response)
+        self.assertEqual(get_view_counter().count(self.post.pk), 2)
+
+
+class QueryPlanTest(TestCase):
+    """
+    Планы горячих запросов на заполненной базе: тест падает, если запрос перестал идти по индексу
+    и читает таблицу целиком. На PostgreSQL последовательное чтение запрещается (enable_seqscan = off):
+    на маленькой тестовой таблице оно дешевле, и без запрета план не показал бы, есть ли подходящий индекс.
+    По умолчанию тесты идут на SQLite; на PostgreSQL — с TEST_POSTGRES=1 (отдельный шаг CI).
+    """
+
+    POSTS = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(phone_number=f"+7900000{i:04d}", email=f"{i}@test.ru") for i in range(30)
+        )
+        posts = Post.objects.bulk_create(
+            Post(
+                title=f"Пост {i}",
+                author=cls.users[i % len(cls.users)],
+                public=i % 10 != 0,
+                premium=i % 3 == 0,
+                media_type=MediaType.VIDEO if i % 2 else MediaType.IMAGE,
+            )
+            for i in range(cls.POSTS)
+        )
+        for i, post in enumerate(posts):  # Посты за год, по одному в день: в окно популярного попадает малая часть
+            Post.objects.filter(pk=post.pk).update(created_at=now() - timedelta(days=i))
+        cls.post = posts[0]
+        Subscription.objects.bulk_create(
+            Subscription(user=user, ends_at=now() + timedelta(days=i - 15), active=True)
+            for i, user in enumerate(cls.users)
+        )
+        Like.objects.bulk_create(Like(user=user, post=post) for user in cls.users for post in posts[:20])
+        TrendingScore.objects.bulk_create(TrendingScore(post=post, score=i) for i, post in enumerate(posts[:50]))
+        Payment.objects.bulk_create(Payment(user=user, amount=100) for user in cls.users for _ in range(5))
+        for post in posts[:10]:
+            root = create_comment(cls.users[0], post.pk, "Комментарий")
+            create_comment(cls.users[1], post.pk, "Ответ", root)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")  # Действует до отката транзакции теста
+
+    def full_scans(self, plan):
+        """Строки плана с чтением всей таблицы мимо индексов"""
+        if connection.vendor == "postgresql":
+            return [line for line in plan.splitlines() if "Seq Scan" in line]
+        return [line for line in plan.splitlines() if " SCAN " in f" {line} " and "USING" not in line]
+
+    def assertIndexScan(self, queryset, index=None):
+        plan = queryset.explain()
+        self.assertFalse(self.full_scans(plan), f"{queryset.query}\n{plan}")
+        if index:
+            self.assertIn(index, plan, f"{queryset.query}\n{plan}")
+
+    def test_feed(self):
+        feed = Post.objects.cards().order_by("-created_at", "-pk")
+        self.assertIndexScan(feed[:6], "post_feed_idx")
+        post = self.post
+        cursor = Q(created_at__lt=post.created_at) | Q(created_at=post.created_at, pk__lt=post.pk)
+        self.assertIndexScan(feed.filter(cursor)[:6], "post_feed_idx")
+        self.assertIndexScan(feed.filter(media_type=MediaType.VIDEO)[:6], "post_media_feed_idx")
+        self.assertIndexScan(Post.objects.order_by("-updated_at").values("updated_at")[:1], "post_updated_idx")
+
+    def test_trending(self):
+        trending = Post.objects.cards().filter(trending__isnull=False).order_by("-trending__score", "-pk")
+        self.assertIndexScan(trending[:6], "trending_score_idx")
+        self.assertIndexScan(stale_posts(full=True), "post_published_idx")
+
+    def test_subscriptions(self):
+        subscriptions = Subscription.objects.filter(user=self.users[0], active=True, ends_at__gt=now())
+        self.assertIndexScan(subscriptions.values("ends_at"), "subscription_user_ends_idx")
+        expired = Subscription.objects.filter(active=True, ends_at__lte=now()).order_by("ends_at")
+        self.assertIndexScan(expired.values("pk", "user")[:100], "subscription_expiry_idx")
+
+    def test_likes_and_comments(self):
+        self.assertIndexScan(Like.objects.filter(user=self.users[0], post__in=[self.post.pk]).values("post"))
+        self.assertIndexScan(Comment.objects.filter(post=self.post, parent=None).order_by("path"))
+        self.assertIndexScan(Comment.objects.filter(post=self.post, path__startswith="0000000001.").order_by("path"))
+
+    def test_payments(self):
+        self.assertIndexScan(Payment.objects.order_by("-payment_date")[:10], "payment_date_idx")
+        user_payments = Payment.objects.filter(user=self.users[0]).order_by("-payment_date")
+        self.assertIndexScan(user_payments[:10], "payment_user_date_idx")
+
+    @skipUnless(connection.vendor == "postgresql", "Оценка по статистике планировщика есть только у PostgreSQL")
+    def test_estimated_count(self):
+        public = Post.objects.filter(public=True)
+        with self.assertNumQueries(2):  # EXPLAIN, а на маленькой таблице ещё и точный COUNT(*)
+            count = estimated_count(public)
+        self.assertEqual(count, public.count())
+
+
+class ForbiddenWordsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(phone_number="+791111111111")
+
+    def test_forms_of_forbidden_words(self):
+        for text in ["Казино!", "играем в казино.", "Звоните в полицию", "курс криптовалют", "kaзинo", "ка\u00adзино"]:
+            with self.subTest(text=text):
+                self.assertTrue(forbidden_words.find(text))
+        for text in ["Обманщик", "биржевой курс", "Обычный текст", ""]:
+            with self.subTest(text=text):
+                self.assertFalse(forbidden_words.find(text))
+
+    def test_post_form_rejects_forbidden_word(self):
+        form = PostForm(data={"title": "Лучшее казино!", "description": "Описание"}, user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertIn("казино", form.errors["title"][0])
+
+        form = PostForm(data={"title": "Заголовок", "description": "Без обмана"}, user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertIn("обмана", form.errors["description"][0])
+
+    def test_rescan_command(self):
+        clean = Post.objects.create(title="Заголовок", description="Описание", author=self.user)
+        banned = Post.objects.create(title="Заголовок", description="Ставки на бирже", author=self.user)
+
+        out = io.StringIO()
+        call_command("rescan_forbidden_words", workers=1, batch_size=1, unpublish=True, stdout=out)
+
+        self.assertIn(f"Пост {banned.pk}: бирже", out.getvalue())
+        self.assertIn("Найдено постов: 1", out.getvalue())
+        banned.refresh_from_db()
+        clean.refresh_from_db()
+        self.assertFalse(banned.public)
+        self.assertTrue(clean.public)
@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from posts.models import Post, TrendingScore
+from posts.page_cache import invalidate_pages
+
+TRENDING_WINDOW = timedelta(days=30)  # Более старые посты в популярное не попадают
+VIEW_WEIGHT = 1
+LIKE_WEIGHT = 10
+COMMENT_WEIGHT = 20
+# Пост, опубликованный на DECAY_SECONDS позже, стоит в 10 раз большей активности
+DECAY_SECONDS = 45000
+REFRESH_BATCH_SIZE = 2000
+
+SCORE_COLUMNS = ["id", "view_count", "like_count", "comment_count", "created_at"]
+
+
+def compute_scores(frame):
+    """
+    Рейтинг «горячего» для таблицы постов: log10 взвешенной активности плюс время публикации.
+    Затухание заложено в слагаемое времени, поэтому рейтинг не зависит от момента расчёта:
+    пересчитывать нужно только посты, у которых изменились счётчики.
+    """
+    activity = (
+        VIEW_WEIGHT * frame["view_count"].to_numpy(dtype=np.float64)
+        + LIKE_WEIGHT * frame["like_count"].to_numpy(dtype=np.float64)
+        + COMMENT_WEIGHT * frame["comment_count"].to_numpy(dtype=np.float64)
+    )
+    published = (pd.to_datetime(frame["created_at"], utc=True) - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+    return np.log10(np.maximum(activity, 1)) + published.to_numpy() / DECAY_SECONDS
+
+
+def stale_posts(full=False):
+    """Посты окна, у которых ещё нет рейтинга или счётчики изменились с прошлого расчёта"""
+    posts = Post.objects.filter(public=True, created_at__gte=now() - TRENDING_WINDOW)
+    if not full:
+        posts = posts.filter(
+            Q(trending__isnull=True)
+            | ~Q(trending__view_count=F("view_count"))
+            | ~Q(trending__like_count=F("like_count"))
+            | ~Q(trending__comment_count=F("comment_count"))
+        )
+    return posts.order_by("created_at", "pk").values_list(*SCORE_COLUMNS)  # По индексу post_published_idx
+
+
+def refresh_trending(full=False, batch_size=REFRESH_BATCH_SIZE):
+    """Пересчитывает рейтинги изменившихся постов пачками и убирает вышедшие из окна. Возвращает число пересчитанных"""
+    refreshed = 0
+    rows = stale_posts(full).iterator(chunk_size=batch_size)
+    while batch := [row for _, row in zip(range(batch_size), rows)]:
+        frame = pd.DataFrame(batch, columns=SCORE_COLUMNS)
+        frame["score"] = compute_scores(frame)
+        TrendingScore.objects.bulk_create(
+            [
+                TrendingScore(
+                    post_id=row.id,
+                    score=row.score,
+                    view_count=row.view_count,
+                    like_count=row.like_count,
+                    comment_count=row.comment_count,
+                )
+                for row in frame.itertuples(index=False)
+            ],
+            update_conflicts=True,
+            unique_fields=["post"],
+            update_fields=["score", "view_count", "like_count", "comment_count", "computed_at"],
+        )
+        refreshed += len(frame)
+
+    expired = TrendingScore.objects.filter(
+        Q(post__created_at__lt=now() - TRENDING_WINDOW) | Q(post__public=False)
+    ).delete()[0]
+    if refreshed or expired:
+        invalidate_pages("trending")
+    return refreshed
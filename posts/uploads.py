@@ -0,0 +1,150 @@
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.timezone import now
+
+from posts.models import StoredFile, UploadSession
+from posts.storage import PARTIAL_DIR, content_storage
+
+READ_BLOCK_SIZE = 64 * 1024
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+SNIFF_LENGTH = 12  # Столько первых байт нужно, чтобы узнать любой из форматов ниже
+# Допустимые форматы: расширения, которые может носить файл, и проверка его первых байт
+UPLOAD_SIGNATURES = (
+    ({"mp4"}, lambda head: head[4:8] == b"ftyp"),
+    ({"mkv"}, lambda head: head.startswith(b"\x1a\x45\xdf\xa3")),
+    ({"avi"}, lambda head: head.startswith(b"RIFF") and head[8:12] == b"AVI "),
+    ({"jpg", "jpeg"}, lambda head: head.startswith(b"\xff\xd8\xff")),
+    ({"png"}, lambda head: head.startswith(b"\x89PNG\r\n\x1a\n")),
+    ({"gif"}, lambda head: head[:6] in (b"GIF87a", b"GIF89a")),
+)
+UPLOAD_EXTENSIONS = set().union(*(extensions for extensions, _ in UPLOAD_SIGNATURES))
+STALE_UPLOAD_AGE = timedelta(days=1)
+
+
+class UploadError(Exception):
+    """Ошибка загрузки с HTTP-статусом ответа"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def file_extension(filename):
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+
+def matches_signature(head, extension):
+    """Совпадают ли первые байты файла с форматом, который обещает расширение"""
+    return any(extension in extensions and check(head) for extensions, check in UPLOAD_SIGNATURES)
+
+
+def start_upload(user, filename, size, sha256=""):
+    """
+    Начинает загрузку: проверяет заявленные тип и размер, пока не передано ни байта,
+    и заводит пустой файл в PARTIAL_DIR, куда будут дописываться части.
+    SHA-256 всего файла необязателен: без него сумму считает finish_upload, а целостность держится на суммах частей.
+    """
+    if file_extension(filename) not in UPLOAD_EXTENSIONS:
+        raise UploadError("Недопустимый тип файла.", status=415)
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        raise UploadError("Файл слишком большой.", status=413)
+    if sha256 and not SHA256_RE.match(sha256):
+        raise UploadError("Неверная контрольная сумма.")
+    name = default_storage.save(f"{PARTIAL_DIR}/{os.path.basename(filename)}", ContentFile(b""))
+    return UploadSession.objects.create(user=user, name=name, size=size, sha256=sha256)
+
+
+def cancel_upload(session):
+    """
+    Удаляет загрузку и её файл. Файл завершённой загрузки уже лежит в хранилище по содержимому
+    и удаляется, только если на него не ссылается ни один пост.
+    """
+    if not session.completed or not StoredFile.objects.filter(name=session.name).exists():
+        default_storage.delete(session.name)
+    session.delete()
+
+
+def append_chunk(session, offset, length, stream, sha256):
+    """
+    Дописывает часть файла с позиции offset, читая тело запроса блоками прямо в итоговый файл.
+    Позиция должна совпадать с принятым объёмом: иначе клиент узнаёт из статуса, откуда продолжать.
+    Первая часть проверяется по сигнатуре формата до записи, чужой файл сразу отклоняется.
+    Часть с неверной суммой sha256 не засчитывается: клиент отправляет её заново с той же позиции.
+    """
+    if not SHA256_RE.match(sha256):
+        raise UploadError("Неверная контрольная сумма части.")
+    head = b""
+    if offset == 0 == session.received:
+        head = stream.read(min(SNIFF_LENGTH, length))
+        if not matches_signature(head, file_extension(session.name)):
+            cancel_upload(session)
+            raise UploadError("Содержимое файла не соответствует его типу.", status=415)
+
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.completed or offset != session.received:
+            raise UploadError("Неверная позиция части.", status=409)
+        if not 0 < length <= settings.UPLOAD_CHUNK_MAX_SIZE or offset + length > session.size:
+            raise UploadError("Часть слишком большая.", status=413)
+
+        with open(default_storage.path(session.name), "r+b") as target:
+            target.seek(offset)
+            target.write(head)
+            digest = hashlib.sha256(head)
+            received = len(head)
+            while received < length and (block := stream.read(min(READ_BLOCK_SIZE, length - received))):
+                target.write(block)
+                digest.update(block)
+                received += len(block)
+            target.truncate()  # Хвост от оборванной попытки отправить эту же часть
+
+        if received != length:  # Соединение оборвалось: часть не засчитывается, клиент повторит её
+            raise UploadError("Часть передана не полностью.")
+        if digest.hexdigest() != sha256:
+            raise UploadError("Контрольная сумма части не совпадает, отправьте её заново.")
+        session.received = offset + length
+        session.save(update_fields=["received"])
+    return session
+
+
+def finish_upload(session):
+    """
+    Считает SHA-256 полностью принятого файла и переносит его на место по хешу содержимого
+    (если такой файл уже загружали, копия удаляется). Если клиент заявил сумму при старте
+    и она не совпала, загрузка отменяется.
+    """
+    if session.received != session.size:
+        raise UploadError("Файл передан не полностью.", status=409)
+    digest = hashlib.sha256()
+    with default_storage.open(session.name, "rb") as source:
+        for block in iter(lambda: source.read(READ_BLOCK_SIZE), b""):
+            digest.update(block)
+    if session.sha256 and digest.hexdigest() != session.sha256:
+        cancel_upload(session)
+        raise UploadError("Контрольная сумма не совпадает, загрузите файл заново.")
+    session.sha256 = digest.hexdigest()
+    session.name = content_storage.adopt(
+        default_storage.path(session.name), session.sha256, file_extension(session.name)
+    )
+    session.completed = True
+    session.save(update_fields=["name", "sha256", "completed"])
+    return session
+
+
+def clear_stale_uploads(max_age=STALE_UPLOAD_AGE):
+    """
+    Удаляет брошенные загрузки вместе с файлами: и недокачанные, и завершённые, но так и не
+    прикреплённые к посту (после публикации сессия удаляется). Возвращает число удалённых.
+    """
+    stale = UploadSession.objects.filter(created_at__lt=now() - max_age)
+    for session in stale:
+        cancel_upload(session)
+    return len(stale)
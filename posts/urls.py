@@ -3,20 +3,43 @@ from django.conf.urls.static import static
 from django.urls import path
 
 from posts.apps import PostsConfig
+from posts.counters import counts_post_view
+from posts.page_cache import cache_page_for_audience
 from posts.views import (PostCreateView, PostDeleteView, PostDetailView, PostListView, PostUpdateView,
-                         SearchResultsView, contacts)
+                         SearchResultsView, TrendingListView, contacts, feed_last_modified, post_comment,
+                         post_last_modified, post_like, post_preview, protected_media, search_suggest, upload_chunk,
+                         upload_finish, upload_start)
 
 app_name = PostsConfig.name
 
 
 urlpatterns = [
-    path("", PostListView.as_view(), name="home"),
+    path("", cache_page_for_audience("feed", last_modified=feed_last_modified)(PostListView.as_view()), name="home"),
+    path(
+        "trending/",
+        cache_page_for_audience("feed", "trending", last_modified=feed_last_modified)(TrendingListView.as_view()),
+        name="trending",
+    ),
     path("contacts/", contacts, name="contacts"),
-    path("post/<int:pk>/", (PostDetailView.as_view()), name="post_detail"),
+    path(
+        "post/<int:pk>/",
+        counts_post_view(
+            cache_page_for_audience("post:{pk}", last_modified=post_last_modified)(PostDetailView.as_view())
+        ),
+        name="post_detail",
+    ),
     path("create_post/", PostCreateView.as_view(), name="post_create"),
     path("<int:pk>/update/", PostUpdateView.as_view(), name="post_update"),
     path("<int:pk>/delete/", PostDeleteView.as_view(), name="post_delete"),
+    path("post/<int:pk>/like/", post_like, name="post_like"),
+    path("post/<int:pk>/comment/", post_comment, name="post_comment"),
+    path("post/<int:pk>/preview/", post_preview, name="post_preview"),
     path("search/", SearchResultsView.as_view(), name="search_results"),
+    path("search/suggest/", search_suggest, name="search_suggest"),
+    path("media-access/<path:path>", protected_media, name="protected_media"),
+    path("uploads/", upload_start, name="upload_start"),
+    path("uploads/<uuid:pk>/", upload_chunk, name="upload_chunk"),
+    path("uploads/<uuid:pk>/finish/", upload_finish, name="upload_finish"),
 ]
 
 if settings.DEBUG:
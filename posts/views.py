@@ -1,45 +1,113 @@
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
+from django.db.models import F, Max
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.urls import reverse_lazy
-from django.utils.safestring import mark_safe
+from django.urls import reverse, reverse_lazy
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlencode
+from django.views.decorators.http import require_http_methods, require_POST
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, TemplateView, UpdateView
 
-from posts.forms import PostForm
-from posts.models import Post, Subscription
-from posts.paginations import CustomPagination
+from posts.cards import card_variant, render_cards
+from posts.forms import CommentForm, PostForm
+from posts.media import preview_response, protected_media_response
+from posts.models import Comment, MediaType, Post, UploadSession
+from posts.page_cache import mark_private
+from posts.paginations import CursorPaginator, InvalidCursor, SequenceCursorPaginator
+from posts.search import get_search_engine
+from posts.services import comment_threads, create_comment, liked_post_ids, toggle_like
+from posts.uploads import UploadError, append_chunk, finish_upload, start_upload
+
+
+class SingleObjectCacheMixin:
+    """Запоминает загруженный объект, чтобы test_func и обработчик запроса не читали его из БД дважды"""
+
+    def get_object(self, queryset=None):
+        if queryset is None and getattr(self, "_cached_object", None) is not None:
+            return self._cached_object
+        obj = super().get_object(queryset)
+        if queryset is None:
+            self._cached_object = obj
+        return obj
+
+
+def feed_last_modified(**kwargs):
+    """Время последнего изменения постов ленты — чтение края индекса post_updated_idx"""
+    return Post.objects.aggregate(last_modified=Max("updated_at"))["last_modified"]
+
+
+def post_last_modified(pk):
+    return Post.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
 
 
 class PostListView(ListView):
     model = Post
+    queryset = Post.objects.cards()
     paginate_by = 5  # Количество элементов на странице
-    paginator_class = CustomPagination  # Используем кастомный пагинатор
+    page_kwarg = "cursor"
+    cursor_ordering = ("-created_at", "-pk")
+
+    def selected_media_type(self):
+        """Вид медиа из ?media=video|image: лента с отбором идёт по индексу post_media_feed_idx"""
+        media_type = self.request.GET.get("media", "").upper()
+        return media_type if media_type in MediaType.values else ""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if media_type := self.selected_media_type():
+            queryset = queryset.filter(media_type=media_type)
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Получаем список объектов и проходим по ним, создавая расширения
-        extensions = {}
-        for obj in context["object_list"]:
-            if obj.file:
-                extensions[obj.id] = obj.file.name.split(".")[-1]
-            else:
-                extensions[obj.id] = "unknown"  # Значение по умолчанию
-        context["extensions"] = extensions
+        context["media"] = self.selected_media_type().lower()
+        if context["media"]:
+            context["page_query"] = urlencode({"media": context["media"]})
+        context["cards"] = render_cards(context["object_list"], self.request.entitlement)
+        context["post_cards"] = list(zip(context["object_list"], context["cards"]))
+        # Лениво: в закешированной странице лайки заполняет кеш страниц, и запрос не нужен
+        context["liked_post_ids"] = SimpleLazyObject(lambda: liked_post_ids(self.request.user, context["object_list"]))
+        if any(card_variant(post, self.request.entitlement) == "author" for post in context["object_list"]):
+            mark_private(self.request)  # Автор видит свои платные посты открытыми
         return context
 
-    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True):
-        return self.paginator_class(queryset, per_page, orphans, allow_empty_first_page)
+    def paginate_queryset(self, queryset, page_size):
+        """Курсорная пагинация: страница выбирается по ключу сортировки (created_at, pk), а не через OFFSET"""
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.page_kwarg))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class TrendingListView(PostListView):
+    """Популярное: посты по заранее рассчитанному рейтингу (см. posts.trending)"""
+
+    queryset = Post.objects.cards().filter(trending__isnull=False).annotate(trending_score=F("trending__score"))
+    cursor_ordering = ("-trending_score", "-pk")
+    extra_context = {"trending": True}
 
 
 class PostDetailView(DetailView):
     model = Post
+    queryset = Post.objects.cards()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        obj = self.get_object()
-        context["ex"] = obj.file.name.split(".")[-1]
+        context["liked_post_ids"] = SimpleLazyObject(lambda: liked_post_ids(self.request.user, [self.object]))
+        if self.object.comment_count:
+            try:
+                context["comments_page"] = comment_threads(self.object, self.request.GET.get("comments"))
+            except InvalidCursor as e:
+                raise Http404(str(e))
+        context["comment_form"] = CommentForm()
+        # Кнопки редактирования видны только автору, кнопка удаления — ещё и модераторам
+        if self.request.entitlement.is_author(self.object) or self.request.user.has_perm("posts.can_delete_any_post"):
+            mark_private(self.request)
         return context
 
 
@@ -83,26 +151,26 @@ class PostUpdateView(LoginRequiredMixin, UpdateView):
         )
 
 
-class PostDeleteView(LoginRequiredMixin, DeleteView):
+class PostDeleteView(LoginRequiredMixin, SingleObjectCacheMixin, DeleteView):
     model = Post
     success_url = reverse_lazy("posts:home")
 
     def test_func(self):
         obj = self.get_object()
-        return self.request.user.has_perm("posts.can_delete_any_post") or obj.author == self.request.user
+        return self.request.user.has_perm("posts.can_delete_any_post") or obj.author_id == self.request.user.pk
 
     def handle_no_permission(self):
         raise PermissionDenied("У вас нет права удалять продукт.")
 
 
-class UnpublishPostView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class UnpublishPostView(LoginRequiredMixin, UserPassesTestMixin, SingleObjectCacheMixin, UpdateView):
     model = Post
     fields = ["public"]
     template_name_suffix = "_unpublish"
 
     def test_func(self):
         obj = self.get_object()
-        return self.request.user.has_perm("catalog.can_unpublish_post") or obj.author == self.request.user
+        return self.request.user.has_perm("catalog.can_unpublish_post") or obj.author_id == self.request.user.pk
 
     def handle_no_permission(self):
         raise PermissionDenied("У вас нет права отменять публикацию продукта.")
@@ -117,49 +185,146 @@ class UnpublishPostView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
 
 def post_detail(request, pk):
     post = get_object_or_404(Post, pk=pk)
-    file_extentions = post.file.name.split(".")[-1]
-    print("DEBUG", file_extentions)
-    # Бесплатные посты видны всем
-    if not post.premium:
-        return render(request, "posts:post_detail", {"post": post, "ex": file_extentions})
-
-    # Платные посты видим только подписанным пользователям
-    try:
-        subscription = Subscription.objects.get(user=request.user)
-        if subscription.active:
-            return render(request, "posts:post_detail", {"post": post, "ex": file_extentions})
-        else:
-            return redirect("/subscribe/")
-    except Subscription.DoesNotExist:
-        return redirect("/subscribe/")
+    # Бесплатные посты видны всем, платные — автору и подписчикам
+    if request.entitlement.can_view(post):
+        return render(request, "posts/post_detail.html", {"post": post})
+    return redirect("/subscribe/")
 
 
-def post_detail_check(request, pk):
-    post = get_object_or_404(Post, pk=pk)
-    file_extentions = post.file.name.split(".")[-1]
-    file_contents = ""
-    if post.file:
-        file_contents = mark_safe(post.file.read())
-    return render(request, "posts:post_detail", {"post": post, "file_contents": file_contents, "ex": file_extentions})
+def post_preview(request, pk):
+    """Предпросмотр файла поста: читается только начало текста, остальное отдаётся потоком"""
+    post = get_object_or_404(Post.objects.only("pk", "title", "file", "premium", "author", "mime_type"), pk=pk)
+    if not request.entitlement.can_view(post):
+        raise PermissionDenied("Файл доступен только подписчикам.")
+    return preview_response(request, post)
 
 
 class SearchResultsView(TemplateView):
     template_name = "posts/search_results.html"
+    paginate_by = 5  # Как в ленте
 
     def get(self, request, *args, **kwargs):
         query = request.GET.get("q", "")  # Получаем запрос и очищаем пробелы
+        engine = get_search_engine()
 
-        if query:
-            # Производим поиск по названию и описанию
-            results = Post.objects.filter(Q(title__icontains=query) | Q(description__icontains=query))
-        else:
-            # Если запрос пустой, возвращаем пустую коллекцию
-            results = Post.objects.none()
+        # Полнотекстовый поиск по названию и описанию, релевантные посты первыми;
+        # список id выдачи берётся из кеша, из БД загружаются только карточки текущей страницы
+        paginator = SequenceCursorPaginator(engine.cached_search_ids(query) if query else [], self.paginate_by)
+        try:
+            page = paginator.page(request.GET.get("cursor"))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        page.object_list = engine.load(page.object_list)
 
         context = {
-            "results": results,
+            "results": page.object_list,
+            "cards": render_cards(page.object_list, request.entitlement),
+            "page_obj": page,
+            "page_query": urlencode({"q": query}),
             "query": query,
             "user": request.user,  # Добавляем текущего пользователя
         }
+        if query and not paginator.count:
+            # Подсказываем исправленный запрос по словарю заголовков
+            context["suggestion"] = engine.did_you_mean(query)
 
         return render(request, self.template_name, context)
+
+
+def search_suggest(request):
+    """Автодополнение для строки поиска: JSON со списком вариантов запроса"""
+    query = request.GET.get("q", "")
+    return JsonResponse({"query": query, "suggestions": get_search_engine().complete(query)})
+
+
+@login_required
+@require_POST
+def post_like(request, pk):
+    """Ставит или снимает лайк текущего пользователя; отвечает новым состоянием и счётчиком"""
+    post = get_object_or_404(Post.objects.only("pk"), pk=pk)
+    liked, like_count = toggle_like(request.user, post.pk)
+    return JsonResponse({"liked": liked, "like_count": like_count})
+
+
+@login_required
+@require_POST
+def post_comment(request, pk):
+    """Комментарий к посту или ответ на комментарий (поле parent)"""
+    post = get_object_or_404(Post.objects.only("pk", "premium", "author"), pk=pk)
+    if not request.entitlement.can_view(post):
+        raise PermissionDenied("Комментировать платный пост могут только подписчики.")
+
+    form = CommentForm(request.POST)
+    if not form.is_valid():
+        if "parent" in form.errors:
+            return HttpResponseBadRequest("Некорректный комментарий для ответа.")
+        return redirect("posts:post_detail", pk=post.pk)
+    parent = None
+    if form.cleaned_data["parent"]:
+        parent = get_object_or_404(Comment, pk=form.cleaned_data["parent"], post=post)
+    comment = create_comment(request.user, post.pk, form.cleaned_data["text"], parent)
+    return redirect(f"{reverse('posts:post_detail', kwargs={'pk': post.pk})}#comment-{comment.pk}")
+
+
+def protected_media(request, path):
+    """Файл поста по подписанной ссылке или после проверки прав; сами байты отдаёт nginx"""
+    return protected_media_response(request, path)
+
+
+def upload_status(session):
+    return {
+        "upload": session.pk,
+        "offset": session.received,
+        "size": session.size,
+        "completed": session.completed,
+        "chunk_size": settings.UPLOAD_CHUNK_MAX_SIZE,
+    }
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Начало загрузки файла частями: имя и размер (и SHA-256 файла, если указан) проверяются до передачи данных"""
+    try:
+        size = int(request.POST.get("size", ""))
+    except ValueError:
+        return JsonResponse({"error": "Не указан размер файла."}, status=400)
+    try:
+        session = start_upload(request.user, request.POST.get("filename", ""), size, request.POST.get("sha256", ""))
+    except UploadError as e:
+        return JsonResponse({"error": e.message}, status=e.status)
+    return JsonResponse(upload_status(session), status=201)
+
+
+@login_required
+@require_http_methods(["GET", "PUT"])
+def upload_chunk(request, pk):
+    """
+    GET — сколько байт уже принято (с этого места продолжать после обрыва).
+    PUT — очередная часть: тело запроса с позиции из заголовка Upload-Offset, её SHA-256 — в Upload-Sha256.
+    """
+    session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+    if request.method == "GET":
+        return JsonResponse(upload_status(session))
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        length = int(request.headers.get("Content-Length", ""))
+    except ValueError:
+        return JsonResponse({"error": "Не указаны позиция и размер части."}, status=400)
+    try:
+        session = append_chunk(session, offset, length, request, request.headers.get("Upload-Sha256", ""))
+    except UploadError as e:
+        return JsonResponse({"error": e.message}, status=e.status)
+    return JsonResponse(upload_status(session))
+
+
+@login_required
+@require_POST
+def upload_finish(request, pk):
+    """Завершение загрузки: подсчёт (и сверка) контрольной суммы файла. Готовую загрузку указывают в форме поста"""
+    session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+    try:
+        session = finish_upload(session)
+    except UploadError as e:
+        return JsonResponse({"error": e.message}, status=e.status)
+    return JsonResponse(upload_status(session))
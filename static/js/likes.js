@@ -0,0 +1,24 @@
+// Лайки: кнопка отправляет POST на posts:post_like и обновляет счётчик из ответа
+(function () {
+    function csrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : "";
+    }
+
+    document.addEventListener("click", function (event) {
+        const button = event.target.closest(".like-button");
+        if (!button) {
+            return;
+        }
+        button.disabled = true;
+        fetch(button.dataset.url, {method: "POST", headers: {"X-CSRFToken": csrfToken()}})
+            .then(response => response.json())
+            .then(data => {
+                button.classList.toggle("active", data.liked);
+                button.querySelector(".like-count").textContent = data.like_count;
+            })
+            .finally(() => {
+                button.disabled = false;
+            });
+    });
+})();
@@ -0,0 +1,78 @@
+// Загрузка файла поста частями (posts.uploads): файл отправляется кусками на posts:upload_chunk,
+// после обрыва загрузка продолжается с принятого сервером места, а форма уходит уже без файла.
+// Контрольная сумма считается для каждой части отдельно: в памяти не бывает больше одной части файла,
+// а сумму всего файла считает сервер при завершении загрузки
+(function () {
+    function csrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : "";
+    }
+
+    async function sha256(buffer) {
+        const digest = await crypto.subtle.digest("SHA-256", buffer);
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, "0")).join("");
+    }
+
+    async function request(url, options) {
+        const response = await fetch(url, {...options, headers: {"X-CSRFToken": csrfToken(), ...options.headers}});
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error);
+        }
+        return data;
+    }
+
+    async function upload(form, file) {
+        const storageKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        let status = null;
+        if (localStorage.getItem(storageKey)) {
+            status = await request(`${form.dataset.uploadUrl}${localStorage.getItem(storageKey)}/`, {method: "GET"})
+                .catch(() => null);
+        }
+        if (!status) {
+            const body = new FormData();
+            body.append("filename", file.name);
+            body.append("size", file.size);
+            status = await request(form.dataset.uploadUrl, {method: "POST", body: body});
+            localStorage.setItem(storageKey, status.upload);
+        }
+        const url = `${form.dataset.uploadUrl}${status.upload}/`;
+        const chunkSize = status.chunk_size;
+        const progress = form.querySelector(".upload-progress");
+        while (!status.completed && status.offset < status.size) {
+            const chunk = await file.slice(status.offset, status.offset + chunkSize).arrayBuffer();
+            const headers = {"Upload-Offset": status.offset, "Upload-Sha256": await sha256(chunk)};
+            try {
+                status = await request(url, {method: "PUT", body: chunk, headers: headers});
+            } catch (error) {
+                // Обрыв, неверная позиция или повреждённая часть: спрашиваем сервер, сколько он уже принял
+                status = await request(url, {method: "GET"});
+            }
+            progress.value = status.offset / status.size * 100;
+        }
+        if (!status.completed) {
+            status = await request(`${url}finish/`, {method: "POST"});
+        }
+        localStorage.removeItem(storageKey);
+        return status.upload;
+    }
+
+    document.addEventListener("submit", async function (event) {
+        const form = event.target.closest("form[data-upload-url]");
+        const input = form && form.querySelector("input[type=file]");
+        if (!input || !input.files.length) {
+            return;
+        }
+        event.preventDefault();
+        const button = form.querySelector("button[type=submit]");
+        button.disabled = true;
+        try {
+            form.querySelector("input[name=upload]").value = await upload(form, input.files[0]);
+            input.value = "";
+            form.submit();
+        } catch (error) {
+            alert(error.message);
+            button.disabled = false;
+        }
+    });
+})();
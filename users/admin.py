@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.hashers import make_password
 
-from .models import User
+from .models import StripeEvent, StripePrice, User
 
 
 @admin.register(User)
@@ -13,3 +13,14 @@ class CustomUserAdmin(admin.ModelAdmin):
         if obj.password:
             obj.password = make_password(obj.password)
         super().save_model(request, obj, form, change)
+
+
+@admin.register(StripePrice)
+class StripePriceAdmin(admin.ModelAdmin):
+    list_display = ("id", "subscription_level", "amount", "currency", "stripe_price_id", "created_at")
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "type", "received_at", "processed_at")
+    list_filter = ("type",)
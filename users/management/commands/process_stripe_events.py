@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.services import STRIPE_EVENT_BATCH_SIZE, process_stripe_events
+
+
+class Command(BaseCommand):
+    help = "Применяет полученные вебхуком события Stripe к платежам и подпискам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=int, default=0, help="Повторять каждые N секунд (0 — один раз)")
+        parser.add_argument("--batch-size", type=int, default=STRIPE_EVENT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_stripe_events(batch_size=options["batch_size"])
+            self.stdout.write(f"Обработано событий: {processed}")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Subscription
+from users.models import StripePrice
+from users.services import sync_stripe_price
+
+
+class Command(BaseCommand):
+    help = "Сверяет каталог цен StripePrice со Stripe для цен подписок, которые используются сейчас"
+
+    def handle(self, *args, **options):
+        prices = set(Subscription.objects.values_list("subscription_level", "price").distinct())
+        prices |= set(StripePrice.objects.values_list("subscription_level", "amount"))
+        for subscription_level, amount in sorted(prices):
+            catalog = sync_stripe_price(subscription_level, amount)
+            self.stdout.write(f"{subscription_level} {catalog.amount}: {catalog.stripe_price_id}")
+        self.stdout.write(f"Цен в каталоге: {len(prices)}")
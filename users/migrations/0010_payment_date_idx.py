@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0009_remove_payment_paid_post_payment_paid_subscription"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["-payment_date"], name="payment_date_idx"),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0010_payment_date_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripePrice",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("subscription_level", models.CharField(max_length=50, verbose_name="Уровень подписки")),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10, verbose_name="Сумма")),
+                ("currency", models.CharField(default="rub", max_length=3, verbose_name="Валюта")),
+                ("stripe_product_id", models.CharField(max_length=100, verbose_name="ID продукта в Stripe")),
+                ("stripe_price_id", models.CharField(max_length=100, verbose_name="ID цены в Stripe")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")),
+            ],
+            options={
+                "verbose_name": "Цена в Stripe",
+                "verbose_name_plural": "Цены в Stripe",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("subscription_level", "amount", "currency"), name="unique_stripe_price"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0011_stripeprice"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="stripe_payment_id",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=100, null=True, verbose_name="ID платежа в Stripe"
+            ),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="paid_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Дата подтверждения оплаты"),
+        ),
+        migrations.CreateModel(
+            name="StripeEvent",
+            fields=[
+                (
+                    "id",
+                    models.CharField(
+                        max_length=255, primary_key=True, serialize=False, verbose_name="ID события в Stripe"
+                    ),
+                ),
+                ("type", models.CharField(max_length=100, verbose_name="Тип события")),
+                ("payload", models.JSONField(verbose_name="Содержимое события")),
+                ("received_at", models.DateTimeField(auto_now_add=True, verbose_name="Дата получения")),
+                ("processed_at", models.DateTimeField(blank=True, null=True, verbose_name="Дата обработки")),
+            ],
+            options={
+                "verbose_name": "Событие Stripe",
+                "verbose_name_plural": "События Stripe",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("processed_at", None)),
+                        fields=["received_at"],
+                        name="stripe_event_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
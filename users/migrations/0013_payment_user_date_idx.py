@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0012_payment_paid_at_stripeevent"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["user", "-payment_date"], name="payment_user_date_idx"),
+        ),
+    ]
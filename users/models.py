@@ -62,12 +62,68 @@ class Payment(models.Model):
         default="cash",
         verbose_name="Способ оплаты",
     )
-    stripe_payment_id = models.CharField(max_length=100, blank=True, null=True, verbose_name="ID платежа в Stripe")
+    stripe_payment_id = models.CharField(
+        max_length=100, blank=True, null=True, db_index=True, verbose_name="ID платежа в Stripe"
+    )  # ID сессии оплаты: по нему события Stripe находят платёж
+    paid_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата подтверждения оплаты")
     link_payment = models.URLField(max_length=400, verbose_name="Ссылка на оплату", blank=True, null=True)
 
     class Meta:
         verbose_name = "Платёж"
         verbose_name_plural = "Платежи"
+        indexes = [
+            # Список платежей (PaymentListView) сортируется по дате
+            models.Index(fields=["-payment_date"], name="payment_date_idx"),
+            # Платежи одного пользователя от новых к старым
+            models.Index(fields=["user", "-payment_date"], name="payment_user_date_idx"),
+        ]
 
     def __str__(self):
         return f"Платёж {self.user.email}, {self.payment_date}"
+
+
+class StripePrice(models.Model):
+    """Продукт и цена в Stripe для уровня подписки и суммы: создаются один раз и переиспользуются при оплате"""
+
+    subscription_level = models.CharField(max_length=50, verbose_name="Уровень подписки")
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма")
+    currency = models.CharField(max_length=3, default="rub", verbose_name="Валюта")
+    stripe_product_id = models.CharField(max_length=100, verbose_name="ID продукта в Stripe")
+    stripe_price_id = models.CharField(max_length=100, verbose_name="ID цены в Stripe")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Цена в Stripe"
+        verbose_name_plural = "Цены в Stripe"
+        constraints = [
+            models.UniqueConstraint(fields=["subscription_level", "amount", "currency"], name="unique_stripe_price"),
+        ]
+
+    def __str__(self):
+        return f"{self.subscription_level} {self.amount} {self.currency}: {self.stripe_price_id}"
+
+
+class StripeEvent(models.Model):
+    """
+    Событие вебхука Stripe. id события — первичный ключ, поэтому повторная доставка не создаёт дубль;
+    события применяются к платежам и подпискам позже, пачками (users.services.process_stripe_events).
+    """
+
+    id = models.CharField(max_length=255, primary_key=True, verbose_name="ID события в Stripe")
+    type = models.CharField(max_length=100, verbose_name="Тип события")
+    payload = models.JSONField(verbose_name="Содержимое события")
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата получения")
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата обработки")
+
+    class Meta:
+        verbose_name = "Событие Stripe"
+        verbose_name_plural = "События Stripe"
+        indexes = [
+            # Очередь необработанных событий: обработанные в индекс не попадают
+            models.Index(
+                fields=["received_at"], name="stripe_event_pending_idx", condition=models.Q(processed_at=None)
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.id}"
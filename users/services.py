@@ -1,9 +1,28 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
 import stripe
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
 
 from config.settings import STRIPE_API_KEY
+from users.models import Payment, StripeEvent, StripePrice
 
 stripe.api_key = STRIPE_API_KEY
 
+STRIPE_CURRENCY = "rub"
+STRIPE_PRICE_CACHE_KEY = "stripe:price:{level}:{currency}:{amount}"
+# Блокировка поиска и создания цены: одновременные оплаты на холодном кеше не создают цену дважды
+STRIPE_PRICE_LOCK_KEY = "stripe:price:lock:{level}:{currency}:{amount}"
+STRIPE_PRICE_LOCK_TIMEOUT = 30
+STRIPE_PRICE_LOCK_POLL = 0.2
+STRIPE_EVENT_BATCH_SIZE = 100
+SUBSCRIPTION_PERIOD = timedelta(days=30)  # Как в Subscription.set_end_date
+# События Checkout, после которых сессия оплачена (при отложенных способах оплаты — второе)
+STRIPE_PAID_EVENTS = {"checkout.session.completed", "checkout.session.async_payment_succeeded"}
+
 
 def create_stripe_product(product_name):
     """
@@ -18,23 +37,146 @@ def create_stripe_product(product_name):
         return None
 
 
-def create_stripe_price(product_id, amount):
-    """Создает цену в страйпе."""
+def create_stripe_price(product_id, amount, currency=STRIPE_CURRENCY, lookup_key=None):
+    """Создает цену в страйпе. lookup_key переносится на новую цену, даже если он уже занят другой."""
 
     return stripe.Price.create(
-        currency="rub",
+        currency=currency,
         unit_amount=int(amount * 100),
         product=product_id,
+        lookup_key=lookup_key,
+        transfer_lookup_key=lookup_key is not None,
     )
 
 
-def create_stripe_session(price):
+def stripe_lookup_key(subscription_level, amount, currency=STRIPE_CURRENCY):
+    """Ключ цены в Stripe: по нему цена находится повторно, даже если локальный каталог потерян"""
+    return f"{subscription_level}:{currency}:{amount}"
+
+
+def sync_stripe_price(subscription_level, amount, currency=STRIPE_CURRENCY):
+    """
+    Запись каталога StripePrice для уровня подписки и суммы. Цена ищется в Stripe по lookup_key;
+    продукт и цена создаются, только если её там нет. Поиск и создание идут под блокировкой в кеше:
+    параллельный вызов ждёт записи каталога. Если держатель блокировки не успел за STRIPE_PRICE_LOCK_TIMEOUT,
+    цена ищется без неё — дубль lookup_key не появится благодаря transfer_lookup_key. Возвращает запись каталога.
+    """
+    amount = Decimal(amount).quantize(Decimal("0.01"))
+    lock = STRIPE_PRICE_LOCK_KEY.format(level=subscription_level, currency=currency, amount=amount)
+    deadline = time.monotonic() + STRIPE_PRICE_LOCK_TIMEOUT
+    while not cache.add(lock, True, STRIPE_PRICE_LOCK_TIMEOUT):
+        catalog = StripePrice.objects.filter(
+            subscription_level=subscription_level, amount=amount, currency=currency
+        ).first()
+        if catalog is not None:
+            return catalog
+        if time.monotonic() > deadline:
+            break
+        time.sleep(STRIPE_PRICE_LOCK_POLL)
+    try:
+        return _sync_stripe_price(subscription_level, amount, currency)
+    finally:
+        cache.delete(lock)
+
+
+def _sync_stripe_price(subscription_level, amount, currency):
+    lookup_key = stripe_lookup_key(subscription_level, amount, currency)
+    prices = stripe.Price.list(lookup_keys=[lookup_key], limit=1).data
+    if prices:
+        price = prices[0]
+    else:
+        price = create_stripe_price(create_stripe_product(subscription_level), amount, currency, lookup_key)
+    catalog, _ = StripePrice.objects.update_or_create(
+        subscription_level=subscription_level,
+        amount=amount,
+        currency=currency,
+        defaults={"stripe_product_id": price.product, "stripe_price_id": price.id},
+    )
+    cache.set(
+        STRIPE_PRICE_CACHE_KEY.format(level=subscription_level, currency=currency, amount=amount),
+        catalog.stripe_price_id,
+        None,
+    )
+    return catalog
+
+
+def get_stripe_price_id(subscription_level, amount, currency=STRIPE_CURRENCY):
+    """
+    ID цены в Stripe для оплаты подписки: из кеша, затем из каталога StripePrice.
+    К Stripe обращаемся, только когда такой суммы ещё нет в каталоге — то есть после изменения цены.
+    """
+    amount = Decimal(amount).quantize(Decimal("0.01"))
+    key = STRIPE_PRICE_CACHE_KEY.format(level=subscription_level, currency=currency, amount=amount)
+    price_id = cache.get(key)
+    if price_id is None:
+        catalog = StripePrice.objects.filter(
+            subscription_level=subscription_level, amount=amount, currency=currency
+        ).first()
+        if catalog is None:
+            catalog = sync_stripe_price(subscription_level, amount, currency)
+        price_id = catalog.stripe_price_id
+        cache.set(key, price_id, None)
+    return price_id
+
+
+def create_stripe_session(price_id):
     """Создает сессию на оплату в страйпе."""
 
     session = stripe.checkout.Session.create(
         success_url="http://127.0.0.1:8000/",
-        line_items=[{"price": price.get("id"), "quantity": 1}],
+        line_items=[{"price": price_id, "quantity": 1}],
         mode="payment",
     )
 
     return session.get("id"), session.get("url")
+
+
+def record_stripe_event(event):
+    """Сохраняет проверенное событие вебхука; повторная доставка того же события игнорируется"""
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(id=event["id"], type=event["type"], payload=event)], ignore_conflicts=True
+    )
+
+
+def apply_paid_sessions(session_ids):
+    """
+    Отмечает оплаченными платежи сессий Checkout и продлевает их подписки на SUBSCRIPTION_PERIOD.
+    Платёж с paid_at уже учтён, поэтому повторное событие о той же сессии подписку не продлевает.
+    """
+    payments = Payment.objects.select_related("paid_subscription").filter(
+        stripe_payment_id__in=session_ids, paid_at=None
+    )
+    for payment in payments:
+        payment.paid_at = now()
+        payment.save(update_fields=["paid_at"])
+        subscription = payment.paid_subscription
+        if subscription is not None:
+            subscription.ends_at = max(subscription.ends_at or now(), now()) + SUBSCRIPTION_PERIOD
+            subscription.active = True
+            subscription.save()
+
+
+def process_stripe_events(batch_size=STRIPE_EVENT_BATCH_SIZE):
+    """
+    Применяет накопленные события Stripe к платежам и подпискам пачками в порядке получения.
+    Пачка обрабатывается в одной транзакции; параллельный запуск пропускает заблокированные события.
+    Возвращает число обработанных событий.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                StripeEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at=None)
+                .order_by("received_at")[:batch_size]
+            )
+            if not events:
+                return processed
+            paid = [
+                event.payload["data"]["object"]["id"]
+                for event in events
+                if event.type in STRIPE_PAID_EVENTS and event.payload["data"]["object"].get("payment_status") == "paid"
+            ]
+            apply_paid_sessions(paid)
+            StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=now())
+        processed += len(events)
@@ -1,13 +1,24 @@
+import hashlib
+import hmac
+import io
+import json
+import time
 import uuid
-from unittest.mock import patch
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import Mock, patch
 
+from django.core.cache import cache
+from django.core.management import call_command
 from django.http import HttpResponseRedirect
-from django.test import Client, RequestFactory, TestCase
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
+from django.utils.timezone import now
 
-from posts.models import Post
+from posts.models import Post, Subscription
 from users.forms import UserRegisterForm
-from users.models import User
+from users.models import Payment, StripeEvent, StripePrice, User
+from users.services import STRIPE_PRICE_LOCK_KEY, get_stripe_price_id, process_stripe_events
 from users.views import UserCreateView
 
 
@@ -110,3 +121,154 @@ class LogoutViewTest(TestCase):
 
         # Проверяем перенаправление на главную страницу
         self.assertRedirects(response, "/")
+
+
+@patch("users.services.stripe")
+class StripePriceCatalogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(phone_number="+791111111111")
+
+    def test_price_created_once(self, stripe_mock):
+        stripe_mock.Price.list.return_value.data = []
+        stripe_mock.Product.create.return_value.id = "prod_1"
+        stripe_mock.Price.create.return_value.id = "price_1"
+        stripe_mock.Price.create.return_value.product = "prod_1"
+
+        self.assertEqual(get_stripe_price_id("SINGLE", 100), "price_1")
+        cache.clear()
+        self.assertEqual(get_stripe_price_id("SINGLE", Decimal("100.00")), "price_1")
+
+        stripe_mock.Product.create.assert_called_once()
+        stripe_mock.Price.create.assert_called_once()
+        self.assertEqual(stripe_mock.Price.create.call_args.kwargs["lookup_key"], "SINGLE:rub:100.00")
+        self.assertTrue(stripe_mock.Price.create.call_args.kwargs["transfer_lookup_key"])
+        self.assertEqual(StripePrice.objects.get().stripe_product_id, "prod_1")
+
+    def test_concurrent_checkout_waits_for_price(self, stripe_mock):
+        # Другой процесс уже ищет цену: этот ждёт, пока тот запишет её в каталог, и в Stripe не идёт
+        cache.add(STRIPE_PRICE_LOCK_KEY.format(level="SINGLE", currency="rub", amount="100.00"), True)
+
+        def other_process_done(seconds):
+            StripePrice.objects.create(
+                subscription_level="SINGLE", amount=100, stripe_product_id="prod_1", stripe_price_id="price_1"
+            )
+
+        with patch("users.services.time.sleep", side_effect=other_process_done) as sleep:
+            self.assertEqual(get_stripe_price_id("SINGLE", 100), "price_1")
+        sleep.assert_called_once()
+        stripe_mock.Price.list.assert_not_called()
+        stripe_mock.Price.create.assert_not_called()
+
+    def test_existing_stripe_price_reused(self, stripe_mock):
+        stripe_mock.Price.list.return_value.data = [Mock(id="price_2", product="prod_2")]
+
+        self.assertEqual(get_stripe_price_id("SINGLE", 100), "price_2")
+        stripe_mock.Product.create.assert_not_called()
+        stripe_mock.Price.create.assert_not_called()
+
+    def test_checkout_makes_single_stripe_call(self, stripe_mock):
+        StripePrice.objects.create(
+            subscription_level="SINGLE", amount=100, stripe_product_id="prod_1", stripe_price_id="price_1"
+        )
+        stripe_mock.checkout.Session.create.return_value = {"id": "cs_1", "url": "https://checkout.stripe.com/cs_1"}
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse("users:payment_api"))
+
+        self.assertRedirects(response, "https://checkout.stripe.com/cs_1", fetch_redirect_response=False)
+        stripe_mock.checkout.Session.create.assert_called_once()
+        self.assertEqual(stripe_mock.checkout.Session.create.call_args.kwargs["line_items"][0]["price"], "price_1")
+        stripe_mock.Price.list.assert_not_called()
+        stripe_mock.Price.create.assert_not_called()
+        self.assertFalse(Subscription.objects.get(user=self.user).active)  # Активирует вебхук после оплаты
+
+
+class StripeStandIn:
+    """
+    Локальная замена Stripe для вебхука: подписывает записанные события так же, как Stripe
+    (заголовок Stripe-Signature: t=<время>,v1=<HMAC-SHA256 от "<время>.<тело>">), и отправляет их клиентом.
+    """
+
+    SECRET = "whsec_test"
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def checkout_event(event_id, session_id, payment_status="paid", event_type="checkout.session.completed"):
+        return {
+            "id": event_id,
+            "object": "event",
+            "type": event_type,
+            "data": {"object": {"id": session_id, "object": "checkout.session", "payment_status": payment_status}},
+        }
+
+    def post(self, event, secret=SECRET):
+        body = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse("users:stripe_webhook"),
+            body,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=StripeStandIn.SECRET)
+class StripeWebhookTest(TestCase):
+    def setUp(self):
+        self.stripe = StripeStandIn(Client(enforce_csrf_checks=True))
+        self.user = User.objects.create(phone_number="+791111111111")
+        self.subscription = Subscription.objects.create(user=self.user, price=100)
+        self.payment = Payment.objects.create(
+            user=self.user, paid_subscription=self.subscription, amount=100, stripe_payment_id="cs_1"
+        )
+
+    def test_event_recorded_once(self):
+        event = self.stripe.checkout_event("evt_1", "cs_1")
+        self.assertEqual(self.stripe.post(event).status_code, 200)
+        self.assertEqual(self.stripe.post(event).status_code, 200)  # Stripe повторяет доставку
+
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertIsNone(StripeEvent.objects.get().processed_at)
+        self.subscription.refresh_from_db()
+        self.assertFalse(self.subscription.active)  # До обработки события подписка не активна
+
+    def test_invalid_signature_rejected(self):
+        response = self.stripe.post(self.stripe.checkout_event("evt_1", "cs_1"), secret="whsec_other")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=None)
+    def test_missing_secret_rejected(self):
+        with self.assertLogs("users.views", "ERROR"):
+            response = self.stripe.post(self.stripe.checkout_event("evt_1", "cs_1"))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_paid_session_activates_subscription(self):
+        self.stripe.post(self.stripe.checkout_event("evt_1", "cs_1"))
+        # Отложенная оплата приходит вторым событием о той же сессии: подписка не продлевается дважды
+        succeeded = "checkout.session.async_payment_succeeded"
+        self.stripe.post(self.stripe.checkout_event("evt_2", "cs_1", event_type=succeeded))
+        self.stripe.post(self.stripe.checkout_event("evt_3", "cs_other", payment_status="unpaid"))
+
+        call_command("process_stripe_events", batch_size=2, stdout=io.StringIO())
+
+        self.payment.refresh_from_db()
+        self.subscription.refresh_from_db()
+        self.assertIsNotNone(self.payment.paid_at)
+        self.assertTrue(self.subscription.is_valid())
+        self.assertAlmostEqual(self.subscription.ends_at, now() + timedelta(days=30), delta=timedelta(minutes=1))
+        self.assertFalse(StripeEvent.objects.filter(processed_at=None).exists())
+
+    def test_unpaid_session_keeps_subscription_inactive(self):
+        self.stripe.post(self.stripe.checkout_event("evt_1", "cs_1", payment_status="unpaid"))
+        process_stripe_events()
+
+        self.payment.refresh_from_db()
+        self.subscription.refresh_from_db()
+        self.assertIsNone(self.payment.paid_at)
+        self.assertFalse(self.subscription.active)
@@ -5,7 +5,7 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from users.apps import UsersConfig
 from users.views import (CabinetView, CustomLogoutView, PaymentListView, UserCreateView, UserViewSet, payment_api_view,
-                         payment_page, payment_success, verify_phone)
+                         payment_page, payment_success, stripe_webhook, verify_phone)
 
 router = SimpleRouter()
 router.register(r"users", UserViewSet)
@@ -26,5 +26,6 @@ urlpatterns = [
     path("payment_api/", payment_api_view, name="payment_api"),
     path("api/", include(router.urls)),
     path("payment-success/", payment_success, name="payment_success"),
+    path("stripe/webhook/", stripe_webhook, name="stripe_webhook"),
     # path("payments_create/", PaymentCreateAPIView.as_view(), name="payments_create"),
 ]
@@ -8,9 +8,11 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LogoutView as BaseLogoutView
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, FormView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status, viewsets
@@ -23,7 +25,7 @@ from posts.models import Subscription
 from users.forms import SubscriptionForm, UserProfileForm, UserRegisterForm, VerificationCodeForm
 from users.models import Payment, User
 from users.serializers import PaymentSerializer, UserSerializer
-from users.services import create_stripe_price, create_stripe_product, create_stripe_session
+from users.services import create_stripe_session, get_stripe_price_id, record_stripe_event
 from users.utils import generate_verification_code, send_sms
 
 # Настройка логгера
@@ -153,19 +155,17 @@ def payment_api_view(request):
             subscription = Subscription.objects.get(user=request.user)
         except Subscription.DoesNotExist:
 
+            # Срок и активность подписка получит после оплаты, из события Stripe (users.services.process_stripe_events)
             subscription = Subscription.objects.create(
                 user=request.user, subscription_level="SINGLE", price=100.00  # или любая другая сумма
             )
-            subscription.set_end_date()  # Устанавливаем конец подписки
-            subscription.save()
 
             # return render(request, 'users/error.html', {"message": "Подписка не найдена"})
 
-        # Создаем продукт и цену в Stripe
-        post_id = create_stripe_product(subscription.subscription_level)
+        # Продукт и цена берутся из каталога StripePrice: к Stripe идёт один запрос — создание сессии
         amount_in_rub = subscription.price
-        price = create_stripe_price(post_id, amount_in_rub)
-        session_id, payment_link = create_stripe_session(price)
+        price_id = get_stripe_price_id(subscription.subscription_level, amount_in_rub)
+        session_id, payment_link = create_stripe_session(price_id)
 
         # Создаем запись о платеже
         Payment.objects.create(
@@ -176,8 +176,6 @@ def payment_api_view(request):
             stripe_payment_id=session_id,
             link_payment=payment_link,
         )
-        subscription.active = True
-        subscription.save()
 
         # Выполняем редирект на страницу оплаты
         return redirect(payment_link)
@@ -187,23 +185,30 @@ def payment_api_view(request):
 
 @login_required
 def payment_success(request):
-    session_id = request.GET.get("session_id")
+    """
+    Возврат из Stripe после оплаты. Оплату подтверждает вебхук (stripe_webhook), а не этот запрос:
+    в Stripe отсюда не обращаемся, подписка активируется, когда событие будет обработано.
+    """
+    messages.success(request, "Спасибо! Подписка станет активной, как только Stripe подтвердит оплату.")
+    return redirect("users:cabinet")
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    """Приём событий Stripe: проверка подписи и запись в очередь StripeEvent, ответ — сразу"""
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        # Без секрета подпись не проверить; 503 — Stripe повторит доставку, когда секрет появится
+        logger.error("STRIPE_WEBHOOK_SECRET не задан: событие Stripe не принято")
+        return HttpResponse(status=503)
     try:
-        checkout_session = stripe.checkout.Session.retrieve(session_id)
-        current_user = request.user
-        if checkout_session.payment_status == "paid":
-            current_user.subscription_status = True
-            current_user.save()
-            messages.success(request, "Оплата успешно произведена!")
-        else:
-            messages.warning(request, "Платеж пока не подтвержден.")
-
-        # Предполагаем, что идентификатор поста сохранён в метаданных Stripe-сессии
-        post_pk = checkout_session.metadata.get("post_id")
-        return redirect("posts:post_detail", pk=post_pk)
-    except Exception as e:
-        messages.error(request, f"Ошибка обработки платежа: {e}")
-        return redirect("posts:post_detail")
+        event = stripe.Webhook.construct_event(
+            request.body, request.headers.get("Stripe-Signature", ""), settings.STRIPE_WEBHOOK_SECRET
+        )
+    except (ValueError, stripe.SignatureVerificationError):
+        return HttpResponse(status=400)
+    record_stripe_event(event.to_dict())
+    return HttpResponse(status=200)
 
 
 logger = logging.getLogger(__name__)
@@ -229,9 +234,7 @@ class CabinetView(LoginRequiredMixin, FormView):
     def get_context_data(self, **kwargs):
         """Перезаписываем стандартный метод для передачи контекста."""
         context = super().get_context_data(**kwargs)
-        context["has_subscription"] = (
-            hasattr(self.request.user, "subscriptions") and self.request.user.subscriptions.exists()
-        )
+        context["has_subscription"] = self.request.entitlement.is_subscriber
 
         if context["has_subscription"]:
             context["subscription_form"] = SubscriptionForm()